@@ -0,0 +1,174 @@
+import heapq
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+
+ALLOCATION_POLICY = 'lowest_id'
+
+class AllocationPolicy:
+    # Tracks the free spots of one lot; subclasses decide which one pop() hands out.
+    def __init__(self, usage=None):
+        self._free = set()
+
+    def __len__(self):
+        return len(self._free)
+
+    def __contains__(self, spot_id):
+        return spot_id in self._free
+
+    def add(self, spot_id):
+        self._free.add(spot_id)
+
+    def discard(self, spot_id):
+        self._free.discard(spot_id)
+
+    def pop(self):
+        raise NotImplementedError
+
+class LowestIdPolicy(AllocationPolicy):
+    # Min-heap with lazy deletion: discarded ids stay in the heap until popped.
+    def __init__(self, usage=None):
+        super().__init__()
+        self._heap = []
+
+    def add(self, spot_id):
+        if spot_id not in self._free:
+            self._free.add(spot_id)
+            heapq.heappush(self._heap, spot_id)
+
+    def discard(self, spot_id):
+        self._free.discard(spot_id)
+        if len(self._heap) > 2 * len(self._free) + 64:
+            self._heap = list(self._free)
+            heapq.heapify(self._heap)
+
+    def pop(self):
+        while self._heap:
+            spot_id = heapq.heappop(self._heap)
+            if spot_id in self._free:
+                self._free.remove(spot_id)
+                return spot_id
+        return None
+
+class RoundRobinPolicy(AllocationPolicy):
+    # Hands out the next free id after the last one given, wrapping around.
+    def __init__(self, usage=None):
+        super().__init__()
+        self._sorted = []
+        self._last = 0
+
+    def add(self, spot_id):
+        if spot_id not in self._free:
+            self._free.add(spot_id)
+            insort(self._sorted, spot_id)
+
+    def discard(self, spot_id):
+        if spot_id in self._free:
+            self._free.remove(spot_id)
+            del self._sorted[bisect_left(self._sorted, spot_id)]
+
+    def pop(self):
+        if not self._sorted:
+            return None
+        index = bisect_right(self._sorted, self._last)
+        if index == len(self._sorted):
+            index = 0
+        spot_id = self._sorted.pop(index)
+        self._free.remove(spot_id)
+        self._last = spot_id
+        return spot_id
+
+class LeastUsedPolicy(AllocationPolicy):
+    # Heap of (times used, spot id); stale entries are skipped when popped.
+    def __init__(self, usage=None):
+        super().__init__()
+        self._uses = dict(usage or {})
+        self._heap = []
+
+    def add(self, spot_id):
+        if spot_id not in self._free:
+            self._free.add(spot_id)
+            heapq.heappush(self._heap, (self._uses.get(spot_id, 0), spot_id))
+
+    def discard(self, spot_id):
+        self._free.discard(spot_id)
+        if len(self._heap) > 2 * len(self._free) + 64:
+            self._heap = [(self._uses.get(s, 0), s) for s in self._free]
+            heapq.heapify(self._heap)
+
+    def pop(self):
+        while self._heap:
+            uses, spot_id = heapq.heappop(self._heap)
+            if spot_id in self._free and uses == self._uses.get(spot_id, 0):
+                self._free.remove(spot_id)
+                self._uses[spot_id] = uses + 1
+                return spot_id
+        return None
+
+POLICIES = {
+    'lowest_id': LowestIdPolicy,
+    'round_robin': RoundRobinPolicy,
+    'least_used': LeastUsedPolicy,
+}
+
+class SpotAllocator:
+    """Per-lot free-spot index kept in step with parking_spots.
+
+    The database stays authoritative: callers claim the returned spot with a
+    conditional UPDATE and reload the lot when the claim loses, so several
+    worker processes each holding their own allocator remain correct.
+    """
+
+    def __init__(self, policy=ALLOCATION_POLICY):
+        self._lots = {}
+        self._lock = threading.Lock()
+        self.set_policy(policy)
+
+    def set_policy(self, policy):
+        # Lots are reloaded lazily under the new policy on their next booking.
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown allocation policy: {policy}")
+        with self._lock:
+            self.policy = policy
+            self._lots = {}
+
+    def _spot_usage(self, conn, lot_id):
+        if self.policy != 'least_used':
+            return {}
+        return dict(conn.execute('''
+            SELECT id, times_used FROM parking_spots WHERE lot_id = ?
+        ''', (lot_id,)).fetchall())
+
+    def load_lot(self, conn, lot_id):
+        lot = POLICIES[self.policy](self._spot_usage(conn, lot_id))
+        for (spot_id,) in conn.execute('''
+            SELECT id FROM parking_spots WHERE lot_id = ? AND status = 'A'
+        ''', (lot_id,)):
+            lot.add(spot_id)
+
+        with self._lock:
+            self._lots[lot_id] = lot
+
+    def drop_lot(self, lot_id):
+        with self._lock:
+            self._lots.pop(lot_id, None)
+
+    def acquire(self, conn, lot_id):
+        # An empty or unknown lot is reloaded once, which also picks up spots
+        # freed by other worker processes.
+        with self._lock:
+            lot = self._lots.get(lot_id)
+            if lot:
+                return lot.pop()
+
+        self.load_lot(conn, lot_id)
+        with self._lock:
+            return self._lots[lot_id].pop()
+
+    def release(self, lot_id, spot_id):
+        with self._lock:
+            lot = self._lots.get(lot_id)
+            if lot is not None:
+                lot.add(spot_id)
+
+spot_allocator = SpotAllocator()
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone
+import eventlog
+from db import get_db_connection
+
+
+# Aggregations over a user's completed sessions, done in SQL so the pages
+# that show them never pull a user's whole history into Python. They read
+# reservation_history, which includes archived reservations.
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+PERIOD_DAYS = {
+    'week': 7,
+    'month': 30,
+    'year': 365,
+}
+
+GROUPINGS = {
+    'month': "substr(r.created_at, 1, 7)",
+    'day': "substr(r.created_at, 1, 10)",
+    'location': "pl.prime_location_name",
+}
+
+DURATION_HOURS = '''
+    CASE
+        WHEN r.parking_epoch IS NOT NULL AND r.leaving_epoch IS NOT NULL
+        THEN (r.leaving_epoch - r.parking_epoch) / 3600.0
+        ELSE 0
+    END
+'''
+
+def days_ago(days):
+    # The IST calendar day `days` before today, as 'YYYY-MM-DD' (for the
+    # rollup tables) and as the epoch of its midnight (for created_epoch).
+    day = datetime.now(IST).date() - timedelta(days=days)
+    return day.isoformat(), int(datetime(day.year, day.month, day.day, tzinfo=IST).timestamp())
+
+def period_start(period):
+    days = PERIOD_DAYS.get(period)
+    if days is None:
+        return None
+    return days_ago(days)[1]
+
+def _completed_filter(user_id, since):
+    where = "r.user_id = ? AND r.status = 'completed'"
+    params = [user_id]
+    if since:
+        where += " AND r.created_epoch >= ?"
+        params.append(since)
+    return where, params
+
+def session_totals(user_id, since=None):
+    conn = get_db_connection()
+    where, params = _completed_filter(user_id, since)
+
+    row = conn.execute(f'''
+        SELECT COUNT(*) as sessions,
+            COALESCE(SUM(r.parking_cost), 0) as cost,
+            COALESCE(SUM({DURATION_HOURS}), 0) as hours
+        FROM reservation_history r
+        WHERE {where}
+    ''', params).fetchone()
+    return dict(row)
+
+def usage_by(user_id, grouping, since=None):
+    # Returns {key: {'sessions', 'cost', 'hours'}}, most recently used first.
+    conn = get_db_connection()
+    where, params = _completed_filter(user_id, since)
+    key = GROUPINGS[grouping]
+    join = "JOIN parking_spots ps ON r.spot_id = ps.id JOIN parking_lots pl ON ps.lot_id = pl.id" \
+        if grouping == 'location' else ""
+
+    rows = conn.execute(f'''
+        SELECT {key} as group_key,
+            COUNT(*) as sessions,
+            COALESCE(SUM(r.parking_cost), 0) as cost,
+            COALESCE(SUM({DURATION_HOURS}), 0) as hours
+        FROM reservation_history r
+        {join}
+        WHERE {where} AND {key} IS NOT NULL
+        GROUP BY group_key
+        ORDER BY MAX(r.created_epoch) DESC
+    ''', params).fetchall()
+    return {row['group_key']: {'sessions': row['sessions'], 'cost': row['cost'], 'hours': row['hours']}
+            for row in rows}
+
+def status_counts(user_id):
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT status, COUNT(*) FROM reservation_history WHERE user_id = ? GROUP BY status
+    ''', (user_id,)).fetchall()
+    counts = {status: count for status, count in rows}
+    cancelled = eventlog.cancelled_count(user_id, conn)
+    if cancelled:
+        counts['cancelled'] = cancelled
+    return counts
+
+def recent_sessions(user_id, limit, since=None):
+    conn = get_db_connection()
+    where, params = _completed_filter(user_id, since)
+    params.append(limit)
+
+    rows = conn.execute(f'''
+        SELECT r.*, ps.id as spot_number, pl.prime_location_name, pl.address, pl.price_per_hour,
+            COALESCE(NULLIF(r.rate_at_booking, 0), pl.price_per_hour) as rate,
+            {DURATION_HOURS} as duration_hours
+        FROM reservation_history r
+        JOIN parking_spots ps ON r.spot_id = ps.id
+        JOIN parking_lots pl ON ps.lot_id = pl.id
+        WHERE {where}
+        ORDER BY r.created_epoch DESC, r.id DESC
+        LIMIT ?
+    ''', params).fetchall()
+    return [dict(row) for row in rows]
@@ -1,23 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
 import sqlite3
 import hashlib
+import json
 from datetime import datetime, timedelta, timezone
 import os
-from collections import defaultdict
 import math
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from werkzeug.exceptions import ServiceUnavailable
+import db
+from db import get_db_connection, close_db
+from migrations import run_migrations, schema_is_current
+import allocator
+from allocator import spot_allocator
+from cache import cached_query, bump_cache_version, get_cache_version, query_cache
+import events
+from events import event_broker, format_sse, STREAM_KEEPALIVE_SECONDS
+import metrics
+import slowlog
+import analytics
+import eventlog
+import holds
+from holds import hold_scheduler
+import bulkhead
+from bulkhead import admin_report_bulkhead, user_report_bulkhead
 
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+IST = timezone(timedelta(hours=5, minutes=30))
+
 def get_current_timestamp():
-    ist = timezone(timedelta(hours=5, minutes=30))
-    return datetime.now(ist).strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.now(IST).strftime('%Y-%m-%d %H:%M:%S')
+
+def timestamp_epoch(timestamp):
+    # Stored timestamps are IST wall-clock text; the *_epoch columns hold the
+    # same instants as UTC epoch seconds.
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=IST).timestamp())
 
 def create_database():
     conn = get_db_connection()
@@ -87,8 +109,6 @@ def create_database():
         )
     ''')
 
-    conn.commit()
-    conn.close()
     print("Database tables created successfully")
 
 def insert_default_admin():
@@ -103,7 +123,6 @@ def insert_default_admin():
             INSERT INTO admin (username, password_hash, created_at)
             VALUES (?,?, ?)
         ''', ('admin', admin_password,  current_time))
-        conn.commit()
         print("Default admin created - Username: admin, Password: admin123")
 
 def get_user_by_credentials(username, password):
@@ -117,7 +136,6 @@ def get_user_by_credentials(username, password):
     ''', (username, password_hash))
 
     user = cursor.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_admin_by_credentials(username, password):
@@ -131,7 +149,6 @@ def get_admin_by_credentials(username, password):
     ''', (username, password_hash))
 
     admin = cursor.fetchone()
-    conn.close()
     return dict(admin) if admin else None
 
 def create_user(username, email, full_name, password):
@@ -145,21 +162,110 @@ def create_user(username, email, full_name, password):
             INSERT INTO users (username, email, full_name, password_hash, created_at)
             VALUES (?,?,?,?,?)
         ''', (username, email, full_name, password_hash, current_time))
+        bump_cache_version(cursor)
         conn.commit()
         user_id = cursor.lastrowid
-        conn.close()
         return user_id
     except sqlite3.IntegrityError:
-        conn.close()
+        conn.rollback()
         return None
     
-DB_PATH = "parking_app.db"
-if not os.path.exists(DB_PATH):
-    create_database()
-    insert_default_admin()
+def init_database():
+    # Every worker may run this at once. An up-to-date database costs one
+    # read; otherwise BEGIN IMMEDIATE lets the first process create the
+    # tables and default admin while the others wait, then find them there.
+    conn = get_db_connection()
+    if schema_is_current(conn):
+        return
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cursor = conn.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reservations'
+        ''')
+        if cursor.fetchone() is None:
+            create_database()
+            insert_default_admin()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    run_migrations()
 
 app = Flask(__name__)
-app.secret_key = 'this_is_a_very_secret_key' 
+app.config.update(
+    DB_PATH=os.environ.get('PARKING_DB_PATH', db.DB_PATH),
+    POOL_SIZE=int(os.environ.get('PARKING_POOL_SIZE', db.POOL_SIZE)),
+    BUSY_TIMEOUT_MS=db.BUSY_TIMEOUT_MS,
+    SECRET_KEY=os.environ.get('PARKING_SECRET_KEY', 'this_is_a_very_secret_key'),
+    ADMIN_REPORT_CONCURRENCY=int(os.environ.get('PARKING_ADMIN_REPORT_CONCURRENCY', bulkhead.ADMIN_REPORT_CONCURRENCY)),
+    USER_REPORT_CONCURRENCY=int(os.environ.get('PARKING_USER_REPORT_CONCURRENCY', bulkhead.USER_REPORT_CONCURRENCY)),
+    REPORT_WAIT_SECONDS=bulkhead.REPORT_WAIT_SECONDS,
+    MAX_STREAMS=int(os.environ.get('PARKING_MAX_STREAMS', events.MAX_STREAMS)),
+    HOLD_TIMEOUT_SECONDS=int(os.environ.get('PARKING_HOLD_TIMEOUT_SECONDS', holds.HOLD_TIMEOUT_SECONDS)),
+    ALLOCATION_POLICY=os.environ.get('PARKING_ALLOCATION_POLICY', allocator.ALLOCATION_POLICY),
+)
+app.teardown_appcontext(close_db)
+
+def create_app(config=None):
+    """Apply config to the app and bring its database schema up to date.
+
+    Routes are registered on the module-level app, so this configures and
+    returns that app; call it once per process before serving. Calling it
+    again, e.g. to point at another database, also empties the query cache,
+    the spot allocator and the hold scheduler. Besides any
+    Flask setting, config takes DB_PATH, POOL_SIZE and BUSY_TIMEOUT_MS, and
+    ADMIN_REPORT_CONCURRENCY, USER_REPORT_CONCURRENCY and REPORT_WAIT_SECONDS
+    for the threads report pages may hold, MAX_STREAMS for the live event
+    streams one process serves at once. HOLD_TIMEOUT_SECONDS is how long
+    a reservation may stay unstarted before its spot is released; 0 keeps
+    holds until they are started or cancelled. ALLOCATION_POLICY picks
+    which free spot a booking gets: 'lowest_id', 'round_robin' or
+    'least_used'.
+    Spot allocators load each lot on its first booking, so startup does no
+    other database work.
+    """
+    if config:
+        app.config.update(config)
+    # Per-process state cached from a previously configured database.
+    query_cache.clear()
+    # Also forgets every lot, so each is reloaded on its next booking.
+    spot_allocator.set_policy(app.config['ALLOCATION_POLICY'])
+    hold_scheduler.reset()
+    db.configure(app.config['DB_PATH'], app.config['POOL_SIZE'], app.config['BUSY_TIMEOUT_MS'])
+    admin_report_bulkhead.configure(app.config['ADMIN_REPORT_CONCURRENCY'], app.config['REPORT_WAIT_SECONDS'])
+    user_report_bulkhead.configure(app.config['USER_REPORT_CONCURRENCY'], app.config['REPORT_WAIT_SECONDS'])
+    hold_scheduler.configure(app.config['HOLD_TIMEOUT_SECONDS'])
+    event_broker.max_streams = app.config['MAX_STREAMS']
+    init_database()
+    # Nothing stays open, so a server that preloads the app can fork safely.
+    db.close_all()
+    return app
+
+# Scrapers without an admin session can send "Authorization: Bearer <token>".
+METRICS_TOKEN = os.environ.get('PARKING_METRICS_TOKEN')
+
+@app.before_request
+def start_request_metrics():
+    metrics.begin_request()
+
+@app.before_request
+def start_hold_scheduler():
+    hold_scheduler.start(load_pending_holds, expire_holds)
+
+@app.after_request
+def record_request_metrics(response):
+    stats = metrics.end_request()
+    if stats is not None:
+        metrics.metrics_registry.record(request.endpoint or 'unmatched', request.method, response.status_code, stats)
+    return response
+
+@app.teardown_request
+def discard_request_metrics(exception=None):
+    # Only still set when the view raised and after_request never ran.
+    stats = metrics.end_request()
+    if stats is not None:
+        metrics.metrics_registry.record(request.endpoint or 'unmatched', request.method, 500, stats)
 
 def is_logged_in():
     return 'user_id' in session or 'admin_id' in session
@@ -185,32 +291,73 @@ def require_user():
         return redirect(url_for('login'))
     return None
 
+@contextmanager
+def report_slot(limiter):
+    # Report pages share worker threads with reservations; past the limit a
+    # request waits briefly for a slot and is then turned away with a 503
+    # rather than left to take every thread. Enter it after the auth check,
+    # so anonymous requests are never queued or refused here.
+    if not limiter.acquire():
+        raise ServiceUnavailable('Reports are busy right now; please try again in a few seconds.',
+                                 retry_after=max(1, math.ceil(limiter.timeout)))
+    try:
+        yield
+    finally:
+        limiter.release()
+
+def insert_parking_spots(cursor, lot_id, count, current_time):
+    # One set-based statement instead of a Python loop of single-row INSERTs.
+    if count <= 0:
+        return
+    cursor.execute('''
+        INSERT INTO parking_spots (lot_id, status, created_at)
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+        SELECT ?, 'A', ? FROM seq
+    ''', (count, lot_id, current_time))
+
+def insert_parking_lot(cursor, location_name, address, pin_code, price_per_hour, max_spots, current_time):
+    cursor.execute('''
+        INSERT INTO parking_lots (prime_location_name, address, pin_code, price_per_hour, maximum_spots, created_at,
+            total_spots, available_spots, occupied_spots)
+        VALUES (?,?,?,?,?,?,?,?,0)
+    ''', (location_name, address, pin_code, price_per_hour, max_spots, current_time, max_spots, max_spots))
+
+    lot_id = cursor.lastrowid
+    insert_parking_spots(cursor, lot_id, max_spots, current_time)
+    return lot_id
+
 def create_parking_lot(location_name, address, pin_code, price_per_hour, max_spots):
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
         current_time = get_current_timestamp()
-        cursor.execute('''
-            INSERT INTO parking_lots (prime_location_name, address, pin_code, price_per_hour, maximum_spots, created_at)
-            VALUES (?,?,?,?,?,?)
-        ''', (location_name, address, pin_code, price_per_hour, max_spots, current_time))
-
-        lot_id = cursor.lastrowid
-
-        for i in range(max_spots):
-            cursor.execute('''
-                INSERT INTO parking_spots (lot_id, status, created_at)
-                VALUES (?, 'A', ?)
-            ''', (lot_id, current_time))
+        lot_id = insert_parking_lot(cursor, location_name, address, pin_code, price_per_hour, max_spots, current_time)
+        bump_cache_version(cursor)
 
         conn.commit()
-        conn.close()
+        spot_allocator.load_lot(conn, lot_id)
         return lot_id
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return None
     
+def bulk_create_parking_lots(lots):
+    # lots is a list of (location_name, address, pin_code, price_per_hour, max_spots)
+    # tuples, all inserted in one transaction.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        current_time = get_current_timestamp()
+        lot_ids = [insert_parking_lot(cursor, *lot, current_time) for lot in lots]
+        bump_cache_version(cursor)
+        conn.commit()
+        return lot_ids
+    except Exception:
+        conn.rollback()
+        raise
+
 def update_parking_lot(lot_id, location_name, address, pin_code, price_per_hour, max_spots):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -224,8 +371,7 @@ def update_parking_lot(lot_id, location_name, address, pin_code, price_per_hour,
         active_reservations = cursor.fetchone()[0]
         
         if max_spots < active_reservations:
-            conn.close()
-            return False
+            return False, f"Cannot reduce spots below {active_reservations}; they are reserved or occupied"
 
         cursor.execute('''
             SELECT COUNT(*) FROM parking_spots
@@ -240,32 +386,39 @@ def update_parking_lot(lot_id, location_name, address, pin_code, price_per_hour,
         ''', (location_name, address, pin_code, price_per_hour, max_spots, lot_id))
 
         if max_spots > current_spots:
-            current_time = get_current_timestamp()
-            for i in range(max_spots - current_spots):
-                cursor.execute('''
-                    INSERT INTO parking_spots (lot_id, status, created_at)
-                    VALUES (?, 'A', ?)
-                ''', (lot_id, current_time))
+            insert_parking_spots(cursor, lot_id, max_spots - current_spots, get_current_timestamp())
         elif max_spots < current_spots:
             spots_to_delete = current_spots - max_spots
+            # With foreign keys enforced, spots referenced by past reservations
+            # cannot be removed without losing that history.
             cursor.execute('''
-                DELETE FROM parking_spots 
-                WHERE lot_id = ? AND status = 'A' 
+                DELETE FROM parking_spots
+                WHERE lot_id = ? AND status = 'A'
                 AND id IN (
-                    SELECT id FROM parking_spots 
-                    WHERE lot_id = ? AND status = 'A' 
-                    ORDER BY id DESC 
+                    SELECT ps.id FROM parking_spots ps
+                    WHERE ps.lot_id = ? AND ps.status = 'A'
+                    AND NOT EXISTS (SELECT 1 FROM reservations r WHERE r.spot_id = ps.id)
+                    AND NOT EXISTS (SELECT 1 FROM reservations_archive a WHERE a.spot_id = ps.id)
+                    ORDER BY ps.id DESC
                     LIMIT ?
                 )
             ''', (lot_id, lot_id, spots_to_delete))
 
+            if cursor.rowcount < spots_to_delete:
+                removable = cursor.rowcount
+                conn.rollback()
+                return False, f"Only {removable} spots can be removed; the rest are in use or have booking history"
+
+        refresh_lot_counters(cursor, lot_id)
+        bump_cache_version(cursor)
         conn.commit()
-        conn.close()
-        return True
+        spot_allocator.load_lot(conn, lot_id)
+        event_broker.publish(('lot', lot_id), 'lot', {'lot_id': lot_id, 'is_active': True})
+        return True, "Parking lot updated successfully!"
     except Exception as e:
-        conn.close()
-        print(f"Error updating parking lot: {e}")
-        return False
+        conn.rollback()
+        app.logger.exception("Error updating parking lot %s", lot_id)
+        return False, f"Error updating parking lot: {str(e)}"
     
 def delete_parking_lot(lot_id):
     conn = get_db_connection()
@@ -279,101 +432,205 @@ def delete_parking_lot(lot_id):
         occupied_spots = cursor.fetchone()[0]
 
         if occupied_spots > 0:
-            conn.close()
             return False, "Cannot delete lot with occupied spots"
         
         # Soft delete - mark as inactive instead of deleting
         cursor.execute('''
             UPDATE parking_lots SET is_active = 0 WHERE id = ?
         ''', (lot_id,))
+        bump_cache_version(cursor)
 
         conn.commit()
-        conn.close()
+        spot_allocator.drop_lot(lot_id)
+        event_broker.publish(('lot', lot_id), 'lot', {'lot_id': lot_id, 'is_active': False})
         return True, "Parking lot deleted successfully"
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Error deleting parking lot: {str(e)}"
     
+def adjust_lot_counters(cursor, lot_id, freed):
+    # Keeps parking_lots' spot counters in step with one spot changing
+    # status; call it in the same transaction as the parking_spots UPDATE.
+    # Returns the new counters for the live occupancy stream.
+    cursor.execute('''
+        UPDATE parking_lots
+        SET available_spots = available_spots + ?, occupied_spots = occupied_spots - ?
+        WHERE id = ?
+    ''', (freed, freed, lot_id))
+    cursor.execute('''
+        SELECT total_spots, available_spots, occupied_spots FROM parking_lots WHERE id = ?
+    ''', (lot_id,))
+    return dict(cursor.fetchone())
+
+def publish_spot_change(lot_id, spot_id, status, counters, reservation_status=None):
+    # Call after commit, so streams never announce a rolled-back change.
+    event_broker.publish(('lot', lot_id), 'spot', dict(counters, spot_id=spot_id, status=status,
+                                                       reservation_status=reservation_status))
+
+def publish_reservation_change(user_id, reservation_id, status):
+    event_broker.publish(('user', user_id), 'reservation', {'reservation_id': reservation_id, 'status': status})
+
+def refresh_lot_counters(cursor, lot_id=None):
+    cursor.execute('''
+        UPDATE parking_lots
+        SET total_spots = (SELECT COUNT(*) FROM parking_spots ps WHERE ps.lot_id = parking_lots.id),
+            available_spots = (SELECT COUNT(*) FROM parking_spots ps WHERE ps.lot_id = parking_lots.id AND ps.status = 'A'),
+            occupied_spots = (SELECT COUNT(*) FROM parking_spots ps WHERE ps.lot_id = parking_lots.id AND ps.status = 'O')
+        WHERE ? IS NULL OR id = ?
+    ''', (lot_id, lot_id))
+
+def refresh_spot_usage(cursor):
+    # For spots booked outside reserve_parking_spot, e.g. by the seeder.
+    cursor.execute('''
+        UPDATE parking_spots SET times_used = (
+            SELECT COUNT(*) FROM reservation_history r WHERE r.spot_id = parking_spots.id
+        )
+    ''')
+
+def repair_lot_counters():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT pl.id FROM parking_lots pl
+            LEFT JOIN (
+                SELECT lot_id, COUNT(*) as total,
+                    SUM(CASE WHEN status = 'A' THEN 1 ELSE 0 END) as available,
+                    SUM(CASE WHEN status = 'O' THEN 1 ELSE 0 END) as occupied
+                FROM parking_spots
+                GROUP BY lot_id
+            ) s ON s.lot_id = pl.id
+            WHERE pl.total_spots != COALESCE(s.total, 0)
+                OR pl.available_spots != COALESCE(s.available, 0)
+                OR pl.occupied_spots != COALESCE(s.occupied, 0)
+        ''')
+        drifted = [row[0] for row in cursor.fetchall()]
+
+        for lot_id in drifted:
+            refresh_lot_counters(cursor, lot_id)
+        if drifted:
+            bump_cache_version(cursor)
+
+        conn.commit()
+        return drifted
+    except Exception:
+        conn.rollback()
+        raise
+
+@cached_query
 def get_available_parking_lots():
     conn = get_db_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
-        SELECT pl.*,
-            COUNT(ps.id) as total_spots,
-            SUM(CASE WHEN ps.status = 'A' THEN 1 ELSE 0 END) as available_spots,
-            SUM(CASE WHEN ps.status = 'O' THEN 1 ELSE 0 END) as occupied_spots
-        FROM parking_lots pl
-        LEFT JOIN parking_spots ps ON pl.id = ps.lot_id
-        WHERE pl.is_active = 1
-        GROUP BY pl.id
-        HAVING available_spots > 0
-        ORDER BY available_spots DESC, pl.price_per_hour ASC
+        SELECT * FROM parking_lots
+        WHERE is_active = 1 AND available_spots > 0
+        ORDER BY available_spots DESC, price_per_hour ASC
     ''')
     
     lots = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return lots
 
+RESERVE_MAX_ATTEMPTS = 5
+RESERVE_RETRY_BACKOFF = 0.01
+
+reserve_stats = {'attempts': 0, 'retries': 0}
+_reserve_stats_lock = threading.Lock()
+
+def _count_reserve_attempt(retry=False):
+    with _reserve_stats_lock:
+        reserve_stats['attempts'] += 1
+        if retry:
+            reserve_stats['retries'] += 1
+
 def reserve_parking_spot(user_id, lot_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    try:
-        cursor.execute('''
-            SELECT price_per_hour FROM parking_lots WHERE id = ? AND is_active = 1
-        ''', (lot_id,))
-        
-        lot_data = cursor.fetchone()
-        if not lot_data:
-            conn.close()
-            return None, "Parking lot not found or no longer available"
-        
-        current_rate = lot_data[0]
+    for attempt in range(RESERVE_MAX_ATTEMPTS):
+        _count_reserve_attempt(retry=attempt > 0)
+        spot_id = None
+        try:
+            # Take the write lock before reading, so the free-spot pick and the
+            # per-user active check cannot interleave with another booking.
+            cursor.execute('BEGIN IMMEDIATE')
 
-        cursor.execute('''
-            SELECT id FROM parking_spots
-            WHERE lot_id = ? AND status = 'A'
-            ORDER BY id ASC
-            LIMIT 1
-        ''', (lot_id,))
+            cursor.execute('''
+                SELECT price_per_hour FROM parking_lots WHERE id = ? AND is_active = 1
+            ''', (lot_id,))
 
-        spot = cursor.fetchone()
-        if not spot:
-            conn.close()
-            return None, "No available spots in this parking lot"
-        
-        spot_id = spot[0]
+            lot_data = cursor.fetchone()
+            if not lot_data:
+                conn.rollback()
+                return None, "Parking lot not found or no longer available"
 
-        cursor.execute('''
-            SELECT COUNT(*) FROM reservations
-            WHERE user_id = ? AND status IN ('reserved', 'occupied')
-        ''', (user_id,))
-
-        active_count = cursor.fetchone()[0]
-        if active_count > 0:
-            conn.close()
-            return None, "You already have an active reservation"
-        
-        current_time = get_current_timestamp()
-        cursor.execute('''
-            INSERT INTO reservations (spot_id, user_id, status, created_at, rate_at_booking)
-            VALUES (?, ?, 'reserved', ?, ?)
-        ''', (spot_id, user_id, current_time, current_rate))
+            current_rate = lot_data[0]
 
-        reservation_id = cursor.lastrowid
+            spot_id = spot_allocator.acquire(conn, lot_id)
+            if spot_id is None:
+                conn.rollback()
+                return None, "No available spots in this parking lot"
 
-        cursor.execute('''
-            UPDATE parking_spots SET status = 'O' WHERE id = ?
-        ''', (spot_id,))
+            cursor.execute('''
+                SELECT COUNT(*) FROM reservations
+                WHERE user_id = ? AND status IN ('reserved', 'occupied')
+            ''', (user_id,))
+
+            active_count = cursor.fetchone()[0]
+            if active_count > 0:
+                conn.rollback()
+                spot_allocator.release(lot_id, spot_id)
+                return None, "You already have an active reservation"
+
+            # Claim the spot only if it is still free. Losing the claim means
+            # the allocator was stale (e.g. another worker booked it), so
+            # resync the lot and pick again.
+            cursor.execute('''
+                UPDATE parking_spots SET status = 'O', times_used = times_used + 1 WHERE id = ? AND status = 'A'
+            ''', (spot_id,))
 
-        conn.commit()
-        conn.close()
+            if cursor.rowcount == 0:
+                spot_allocator.load_lot(conn, lot_id)
+                conn.rollback()
+                spot_id = None
+                continue
 
-        return reservation_id, f"Parking spot reserved successfully at ₹{current_rate}/hour"
-    except Exception as e:
-        conn.close()
-        return None, f"Error reserved spot: {str(e)}"
+            counters = adjust_lot_counters(cursor, lot_id, -1)
+
+            current_time = get_current_timestamp()
+            current_epoch = timestamp_epoch(current_time)
+            cursor.execute('''
+                INSERT INTO reservations (spot_id, user_id, status, created_at, created_epoch, rate_at_booking)
+                VALUES (?, ?, 'reserved', ?, ?, ?)
+            ''', (spot_id, user_id, current_time, current_epoch, current_rate))
+
+            reservation_id = cursor.lastrowid
+            eventlog.append_event(cursor, 'reserved', reservation_id, lot_id, spot_id, user_id,
+                                  current_time, current_epoch)
+            bump_cache_version(cursor)
+
+            conn.commit()
+            hold_scheduler.schedule(reservation_id, current_epoch)
+            publish_spot_change(lot_id, spot_id, 'O', counters, 'reserved')
+            publish_reservation_change(user_id, reservation_id, 'reserved')
+
+            return reservation_id, f"Parking spot reserved successfully at ₹{current_rate}/hour"
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            if spot_id is not None:
+                spot_allocator.release(lot_id, spot_id)
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                return None, f"Error reserved spot: {str(e)}"
+            time.sleep(RESERVE_RETRY_BACKOFF * (attempt + 1))
+        except Exception as e:
+            conn.rollback()
+            if spot_id is not None:
+                spot_allocator.release(lot_id, spot_id)
+            return None, f"Error reserved spot: {str(e)}"
+
+    return None, "Parking lot is busy right now, please try again"
     
 def start_parking(reservation_id, user_id):
     conn = get_db_connection()
@@ -381,30 +638,153 @@ def start_parking(reservation_id, user_id):
 
     try:
         cursor.execute('''
-            SELECT * FROM reservations
-            WHERE id = ? AND user_id = ? AND status = 'reserved'
+            SELECT r.*, ps.lot_id FROM reservations r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id = ? AND r.user_id = ? AND r.status = 'reserved'
         ''', (reservation_id, user_id))
 
         reservation = cursor.fetchone()
         if not reservation:
-            conn.close()
             return False, "invalid reservation or already started"
         
         current_time = get_current_timestamp()
+        current_epoch = timestamp_epoch(current_time)
         cursor.execute('''
             UPDATE reservations
-            SET status = 'occupied', parking_timestamp = ?
-            WHERE id = ?
-        ''', (current_time, reservation_id))
+            SET status = 'occupied', parking_timestamp = ?, parking_epoch = ?
+            WHERE id = ? AND status = 'reserved'
+        ''', (current_time, current_epoch, reservation_id))
+
+        # Cancelled or started by a concurrent request since the SELECT.
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return False, "invalid reservation or already started"
+
+        eventlog.append_event(cursor, 'started', reservation_id, reservation['lot_id'], reservation['spot_id'],
+                              user_id, current_time, current_epoch)
+        # Streams in other workers only learn of the change through the version.
+        bump_cache_version(cursor)
 
         conn.commit()
-        conn.close()
+        event_broker.publish(('lot', reservation['lot_id']), 'spot', {
+            'spot_id': reservation['spot_id'], 'status': 'O', 'reservation_status': 'occupied'})
+        publish_reservation_change(user_id, reservation_id, 'occupied')
         return True, "Parking started successfully"
     
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Error starting parking: {str(e)}"
 
+def record_completed_session(cursor, lot_id, user_id, day, cost, billed_hours, duration_hours):
+    # Rollups are bumped in the checkout transaction so the admin reports
+    # never need to read the reservations table.
+    cursor.execute('''
+        INSERT INTO lot_daily_stats (lot_id, day, sessions, revenue, billed_hours, duration_hours)
+        VALUES (?, ?, 1, ?, ?, ?)
+        ON CONFLICT (lot_id, day) DO UPDATE SET
+            sessions = sessions + 1,
+            revenue = revenue + excluded.revenue,
+            billed_hours = billed_hours + excluded.billed_hours,
+            duration_hours = duration_hours + excluded.duration_hours
+    ''', (lot_id, day, cost, billed_hours, duration_hours))
+
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, completed_sessions, total_spent)
+        VALUES (?, 1, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            completed_sessions = completed_sessions + 1,
+            total_spent = total_spent + excluded.total_spent
+    ''', (user_id, cost))
+
+def rebuild_rollups():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM lot_daily_stats')
+        cursor.execute('''
+            INSERT INTO lot_daily_stats (lot_id, day, sessions, revenue, billed_hours, duration_hours)
+            SELECT ps.lot_id, substr(r.created_at, 1, 10), COUNT(*),
+                COALESCE(SUM(r.parking_cost), 0),
+                COALESCE(SUM(CASE WHEN r.rate_at_booking > 0 THEN r.parking_cost / r.rate_at_booking ELSE 0 END), 0),
+                COALESCE(SUM((r.leaving_epoch - r.parking_epoch) / 3600.0), 0)
+            FROM reservation_history r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.status = 'completed'
+            GROUP BY ps.lot_id, substr(r.created_at, 1, 10)
+        ''')
+        lot_days = cursor.rowcount
+
+        cursor.execute('DELETE FROM user_stats')
+        cursor.execute('''
+            INSERT INTO user_stats (user_id, completed_sessions, total_spent)
+            SELECT user_id, COUNT(*), COALESCE(SUM(parking_cost), 0)
+            FROM reservation_history
+            WHERE status = 'completed'
+            GROUP BY user_id
+        ''')
+        users = cursor.rowcount
+        bump_cache_version(cursor)
+
+        conn.commit()
+        return lot_days, users
+    except Exception:
+        conn.rollback()
+        raise
+
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_COLUMNS = ('id, spot_id, user_id, parking_timestamp, leaving_timestamp, '
+                   'parking_cost, rate_at_booking, status, created_at, '
+                   'created_epoch, parking_epoch, leaving_epoch')
+
+def archive_completed_reservations(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    # Moves completed reservations booked before the cutoff into
+    # reservations_archive, one short transaction per batch so checkouts are
+    # not held up. The rollups already count these sessions and history reads
+    # reservation_history, so no totals or pages change.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cutoff = int(time.time()) - older_than_days * 86400
+    batch = '''
+        SELECT id FROM reservations
+        WHERE status = 'completed' AND created_epoch < ?
+        ORDER BY created_epoch, id
+        LIMIT ?
+    '''
+
+    archived = 0
+    while True:
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''
+                INSERT INTO reservations_archive ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM reservations WHERE id IN ({batch})
+            ''', (cutoff, batch_size))
+            moved = cursor.rowcount
+            # The write lock is held, so the same batch query selects the same rows.
+            cursor.execute(f'DELETE FROM reservations WHERE id IN ({batch})', (cutoff, batch_size))
+            if cursor.rowcount != moved:
+                raise RuntimeError(f"archived {moved} reservations but deleted {cursor.rowcount}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        archived += moved
+        if moved < batch_size:
+            break
+
+    # Fresh statistics keep the planner driving reservation_history queries
+    # from the created_at indexes once the archive has grown.
+    if archived:
+        cursor.execute('ANALYZE reservations')
+        cursor.execute('ANALYZE reservations_archive')
+        conn.commit()
+    return archived
+
 def end_parking(reservation_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -420,7 +800,6 @@ def end_parking(reservation_id, user_id):
 
         reservation = cursor.fetchone()
         if not reservation:
-            conn.close()
             return False, "Invalid reservation or not currently parked", 0, {}
         
         reservation = dict(reservation)
@@ -437,23 +816,38 @@ def end_parking(reservation_id, user_id):
         )
         
         if 'error' in cost_details:
-            conn.close()
             return False, f"Error calculating cost: {cost_details['error']}", 0, {}
         
+        current_epoch = timestamp_epoch(current_time)
         cursor.execute('''
             UPDATE reservations 
             SET status = 'completed', 
                 leaving_timestamp = ?,
+                leaving_epoch = ?,
                 parking_cost = ?
-            WHERE id = ?
-        ''', (current_time, cost_details['parking_cost'], reservation_id))
+            WHERE id = ? AND status = 'occupied'
+        ''', (current_time, current_epoch, cost_details['parking_cost'], reservation_id))
+
+        # A concurrent checkout of the same reservation already completed it.
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return False, "Invalid reservation or not currently parked", 0, {}
         
         cursor.execute('''
             UPDATE parking_spots SET status = 'A' WHERE id = ?
         ''', (reservation['spot_id'],))
+        counters = adjust_lot_counters(cursor, reservation['lot_id'], 1)
+        eventlog.append_event(cursor, 'ended', reservation_id, reservation['lot_id'], reservation['spot_id'], user_id,
+                              current_time, current_epoch, cost_details['parking_cost'])
+        record_completed_session(cursor, reservation['lot_id'], user_id, reservation['created_at'][:10],
+                                 cost_details['parking_cost'], cost_details['billable_hours'],
+                                 cost_details['duration_hours'])
+        bump_cache_version(cursor)
         
         conn.commit()
-        conn.close()
+        spot_allocator.release(reservation['lot_id'], reservation['spot_id'])
+        publish_spot_change(reservation['lot_id'], reservation['spot_id'], 'A', counters)
+        publish_reservation_change(user_id, reservation_id, 'completed')
         
         success_message = f"""
         Parking ended successfully
@@ -466,92 +860,226 @@ def end_parking(reservation_id, user_id):
         return True, success_message, cost_details['parking_cost'], cost_details
 
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Error ending parking: {str(e)}", 0, {}
     
-def get_user_reservations(user_id, include_completed = False):
+HISTORY_PAGE_SIZE = 20
+ADMIN_TRANSACTIONS_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+def make_page_cursor(row):
+    return f"{row['created_at']}|{row['id']}"
+
+def parse_page_cursor(value):
+    # Cursors are "<created_at>|<id>" of the last row already shown.
+    if not value:
+        return None
+    try:
+        created_at, reservation_id = value.rsplit('|', 1)
+        return created_at, int(reservation_id)
+    except ValueError:
+        return None
+
+def parse_page_size(value, default):
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def split_page(rows, page_size):
+    # Callers fetch one extra row to learn whether another page exists.
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, make_page_cursor(rows[-1])
+    return rows, None
+
+def get_user_reservations(user_id, include_completed = False, before = None, limit = None):
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Active reservations are never archived, so only history reads both tiers.
     if include_completed:
+        source = "reservation_history"
         status_filter = ""
     else:
+        source = "reservations"
         status_filter = "AND r.status IN ('reserved', 'occupied')"
 
+    params = [user_id]
+    if before:
+        status_filter += " AND (r.created_at, r.id) < (?, ?)"
+        params.extend(before)
+
+    limit_clause = ""
+    if limit:
+        limit_clause = "LIMIT ?"
+        params.append(limit)
+
     cursor.execute(f'''
         SELECT r.*, ps.id as spot_number, pl.prime_location_name, pl.address, 
-            COALESCE(r.rate_at_booking, pl.price_per_hour) as price_per_hour,
+            COALESCE(NULLIF(r.rate_at_booking, 0), pl.price_per_hour) as price_per_hour,
             CASE 
-                WHEN r.parking_timestamp IS NOT NULL AND r.leaving_timestamp IS NOT NULL
-                THEN (julianday(r.leaving_timestamp)-julianday(r.parking_timestamp)) *24
+                WHEN r.parking_epoch IS NOT NULL AND r.leaving_epoch IS NOT NULL
+                THEN (r.leaving_epoch - r.parking_epoch) / 3600.0
                 ELSE 0
             END as duration_hours
-        FROM reservations r
+        FROM {source} r
         JOIN parking_spots ps ON r.spot_id = ps.id
         JOIN parking_lots pl ON ps.lot_id = pl.id
         WHERE r.user_id = ? {status_filter}
-        ORDER BY r.created_at DESC
-    ''', (user_id, ))
+        ORDER BY r.created_at DESC, r.id DESC
+        {limit_clause}
+    ''', params)
 
     reservations = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return reservations
 
+def get_user_history_stats(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT completed_sessions, total_spent FROM user_stats WHERE user_id = ?
+    ''', (user_id,))
+    row = cursor.fetchone()
+    completed_sessions, total_spent = row if row else (0, 0)
+
+    cursor.execute('''
+        SELECT COUNT(*) FROM reservations
+        WHERE user_id = ? AND status IN ('reserved', 'occupied')
+    ''', (user_id,))
+    active = cursor.fetchone()[0]
+
+    return {
+        'total_reservations': completed_sessions + active,
+        'completed_sessions': completed_sessions,
+        'total_spent': total_spent,
+        'active': active
+    }
+
 def cancel_reservation(reservation_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
         cursor.execute('''
-            SELECT spot_id from reservations
-            WHERE id = ? AND user_id = ? AND status = 'reserved'
+            SELECT r.spot_id, ps.lot_id from reservations r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id = ? AND r.user_id = ? AND r.status = 'reserved'
         ''', (reservation_id, user_id))
 
         reservation = cursor.fetchone()
         if not reservation:
-            conn.close()
             return False, "Cannot cancel - reservation not found or already in use"
 
-        spot_id = reservation[0]
+        spot_id, lot_id = reservation
 
         cursor.execute('''
             DELETE FROM reservations
-            WHERE id = ?
+            WHERE id = ? AND status = 'reserved'
         ''', (reservation_id, ))
 
+        # Started or cancelled by a concurrent request since the SELECT.
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return False, "Cannot cancel - reservation not found or already in use"
+
         cursor.execute('''
             UPDATE parking_spots
             SET status = 'A'
             WHERE id = ?
         ''', (spot_id, ))
+        counters = adjust_lot_counters(cursor, lot_id, 1)
+        current_time = get_current_timestamp()
+        eventlog.append_event(cursor, 'cancelled', reservation_id, lot_id, spot_id, user_id,
+                              current_time, timestamp_epoch(current_time))
+        bump_cache_version(cursor)
 
         conn.commit()
-        conn.close()
+        spot_allocator.release(lot_id, spot_id)
+        publish_spot_change(lot_id, spot_id, 'A', counters)
+        publish_reservation_change(user_id, reservation_id, 'cancelled')
         return True, "Reservation cancelled successfully"
     
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return False, f"Error cancelling reservation: {str(e)}"
+
+def load_pending_holds():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, created_epoch FROM reservations WHERE status = 'reserved'
+    ''')
+    return cursor.fetchall()
+
+def expire_holds(reservation_ids):
+    # Called by the hold scheduler with reservations whose hold time is up.
+    # Ids that were started or cancelled since they were scheduled no longer
+    # match and are skipped. Expired holds are logged as cancellations.
+    if not hold_scheduler.timeout:
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cutoff = int(time.time()) - hold_scheduler.timeout
+
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT r.id, r.spot_id, r.user_id, ps.lot_id FROM reservations r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id IN (SELECT value FROM json_each(?)) AND r.status = 'reserved' AND r.created_epoch <= ?
+        ''', (json.dumps(reservation_ids), cutoff))
+        expired = [dict(row) for row in cursor.fetchall()]
+        if not expired:
+            conn.rollback()
+            return 0
+
+        cursor.execute('''
+            DELETE FROM reservations WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps([hold['id'] for hold in expired]),))
+        cursor.execute('''
+            UPDATE parking_spots SET status = 'A' WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps([hold['spot_id'] for hold in expired]),))
+
+        freed = {}
+        for hold in expired:
+            freed[hold['lot_id']] = freed.get(hold['lot_id'], 0) + 1
+        counters = {lot_id: adjust_lot_counters(cursor, lot_id, count) for lot_id, count in freed.items()}
+
+        current_time = get_current_timestamp()
+        current_epoch = timestamp_epoch(current_time)
+        for hold in expired:
+            eventlog.append_event(cursor, 'cancelled', hold['id'], hold['lot_id'], hold['spot_id'], hold['user_id'],
+                                  current_time, current_epoch)
+        bump_cache_version(cursor)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for hold in expired:
+        spot_allocator.release(hold['lot_id'], hold['spot_id'])
+        publish_spot_change(hold['lot_id'], hold['spot_id'], 'A', counters[hold['lot_id']])
+        publish_reservation_change(hold['user_id'], hold['id'], 'expired')
+    return len(expired)
     
 
+@cached_query
 def get_all_parking_lots():
     conn = get_db_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
-        SELECT pl.*,
-            COUNT(ps.id) as total_spots,
-            SUM(CASE WHEN ps.status = 'A' THEN 1 ELSE 0 END) as available_spots,
-            SUM(CASE WHEN ps.status = 'O' THEN 1 ELSE 0 END) as occupied_spots
-        FROM parking_lots pl
-        LEFT JOIN parking_spots ps ON pl.id = ps.lot_id
-        WHERE pl.is_active = 1
-        GROUP BY pl.id
-        ORDER BY pl.created_at DESC
+        SELECT * FROM parking_lots
+        WHERE is_active = 1
+        ORDER BY created_at DESC
     ''')
 
     lots = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return lots
 
 def get_parking_lot_details(lot_id):
@@ -565,7 +1093,6 @@ def get_parking_lot_details(lot_id):
     lot = cursor.fetchone()
 
     if not lot:
-        conn.close()
         return None, []
     
     cursor.execute('''
@@ -578,7 +1105,6 @@ def get_parking_lot_details(lot_id):
     ''', (lot_id,))
 
     spots = [dict(row) for row in cursor.fetchall()]
-    conn.close()
 
     return dict(lot), spots
 
@@ -586,89 +1112,63 @@ def get_all_users():
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Completed totals come from user_stats, which also counts archived
+    # sessions; only active reservations are read from the live table.
     cursor.execute('''
-        SELECT u.*, 
-            COUNT(r.id) as total_reservations,
-            COUNT(CASE WHEN r.status IN ('reserved', 'occupied') THEN 1 END) as active_reservations,
-            SUM(CASE WHEN r.status = 'completed' THEN r.parking_cost ELSE 0 END) as total_spent
+        SELECT u.*,
+            COALESCE(us.completed_sessions, 0) + COALESCE(a.active_reservations, 0) as total_reservations,
+            COALESCE(a.active_reservations, 0) as active_reservations,
+            COALESCE(us.total_spent, 0) as total_spent
         FROM users u
-        LEFT JOIN reservations r ON u.id = r.user_id
-        GROUP BY u.id
+        LEFT JOIN user_stats us ON us.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) as active_reservations FROM reservations
+            WHERE status IN ('reserved', 'occupied')
+            GROUP BY user_id
+        ) a ON a.user_id = u.id
         ORDER BY u.created_at DESC
     ''')
 
     users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     return users
 
 def get_user_parking_summary(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    counts = analytics.status_counts(user_id)
+    completed = analytics.session_totals(user_id)
+    completed_count = completed['sessions']
+    total_cost = completed['cost']
+    total_hours = completed['hours']
 
-    cursor.execute('''
-        SELECT r.*, ps.id as spot_number, pl.prime_location_name, pl.address,
-            COALESCE(r.rate_at_booking, pl.price_per_hour) as price_per_hour,
-            CASE
-                WHEN r.parking_timestamp IS NOT NULL AND r.leaving_timestamp IS NOT NULL
-                THEN (julianday(r.leaving_timestamp)-julianday(r.parking_timestamp)) * 24
-                ELSE 0
-            END as duration_hours
-        FROM reservations r
-        JOIN parking_spots ps on r.spot_id = ps.id
-        JOIN parking_lots pl ON ps.lot_id = pl.id
-        WHERE r.user_id = ?
-        ORDER BY r.created_at DESC
-    ''', (user_id, ))
-
-    all_reservations = [dict(row) for row in cursor.fetchall()]
-
-    total_reservations = len(all_reservations)
-    completed_sessions = [r for r in all_reservations if r['status'] == 'completed']
-    active_sessions = [r for r in all_reservations if r['status'] in ['reserved', 'occupied']]
-    cancelled_sessions = [r for r in all_reservations if r['status'] == 'cancelled']
-
-    total_cost = sum(r['parking_cost'] or 0 for r in completed_sessions)
-    total_hours = sum(r['duration_hours'] or 0 for r in completed_sessions)
-
-    monthly_data = defaultdict(lambda: {'count':0, 'cost':0, 'hours':0})
-    for reservation in completed_sessions:
-        if reservation['created_at']:
-            month_key = reservation['created_at'][:7]
-            monthly_data[month_key]['count'] += 1
-            monthly_data[month_key]['cost'] += reservation['parking_cost'] or 0
-            monthly_data[month_key]['hours'] += reservation['duration_hours'] or 0
-
-    location_stats = defaultdict(lambda: {'count':0, 'cost':0, 'hours':0})
-    for reservation in completed_sessions:
-        location = reservation['prime_location_name']
-        location_stats[location]['count'] += 1
-        location_stats[location]['cost'] += reservation['parking_cost'] or 0
-        location_stats[location]['hours'] += reservation['duration_hours'] or 0
-
-    thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    recent_sessions = [r for r in completed_sessions if r['created_at'] and r['created_at']>=thirty_days_ago]
-    conn.close()
+    monthly_data = {month: {'count': data['sessions'], 'cost': data['cost'], 'hours': data['hours']}
+                    for month, data in analytics.usage_by(user_id, 'month').items()}
+    location_stats = {location: {'count': data['sessions'], 'cost': data['cost'], 'hours': data['hours']}
+                      for location, data in analytics.usage_by(user_id, 'location').items()}
+
+    recent = analytics.session_totals(user_id, since=analytics.days_ago(30)[1])
+    active_sessions = get_user_reservations(user_id, include_completed=False)
 
     summary = {
-        'total_reservations': total_reservations,
-        'completed_sessions': len(completed_sessions),
+        # Completed and active, as on the history page; cancellations are counted separately.
+        'total_reservations': sum(count for status, count in counts.items() if status != 'cancelled'),
+        'completed_sessions': completed_count,
         'active_sessions': len(active_sessions),
-        'cancelled_sessions': len(cancelled_sessions),
+        'cancelled_sessions': counts.get('cancelled', 0),
         'total_cost': total_cost,
         'total_hours': total_hours,
-        'average_cost_per_session': total_cost / len(completed_sessions) if completed_sessions else 0,
-        'average_duration': total_hours/ len(completed_sessions) if completed_sessions else 0,
-        'monthly_data': dict(monthly_data),
-        'location_stats': dict(location_stats),
-        'recent_activity_30days': len(recent_sessions),
-        'recent_cost_30days': sum(r['parking_cost'] or 0 for r in recent_sessions),
-        'all_reservations': all_reservations,
-        'completed_reservations': len(completed_sessions),
+        'average_cost_per_session': total_cost / completed_count if completed_count else 0,
+        'average_duration': total_hours/ completed_count if completed_count else 0,
+        'monthly_data': monthly_data,
+        'location_stats': location_stats,
+        'recent_activity_30days': recent['sessions'],
+        'recent_cost_30days': recent['cost'],
+        'recent_completed': analytics.recent_sessions(user_id, 10),
+        'completed_reservations': completed_count,
         'active_reservations': active_sessions
     }
 
     return summary
 
+@cached_query
 def get_admin_parking_summary():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -679,23 +1179,10 @@ def get_admin_parking_summary():
     total_users = cursor.fetchone()[0]
 
     cursor.execute('''
-        SELECT COUNT(*) FROM parking_lots WHERE is_active = 1
+        SELECT COUNT(*), COALESCE(SUM(total_spots), 0), COALESCE(SUM(occupied_spots), 0)
+        FROM parking_lots WHERE is_active = 1
     ''')
-    total_lots = cursor.fetchone()[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) FROM parking_spots ps
-        JOIN parking_lots pl ON ps.lot_id = pl.id
-        WHERE pl.is_active = 1
-    ''')
-    total_spots = cursor.fetchone()[0]
-
-    cursor.execute('''
-        SELECT COUNT(*) FROM parking_spots ps
-        JOIN parking_lots pl ON ps.lot_id = pl.id
-        WHERE ps.status = 'O' AND pl.is_active = 1
-    ''')
-    occupied_spots = cursor.fetchone()[0]
+    total_lots, total_spots, occupied_spots = cursor.fetchone()
 
     cursor.execute('''
         SELECT COUNT(*) FROM reservations WHERE status IN ('reserved', 'occupied')
@@ -703,54 +1190,42 @@ def get_admin_parking_summary():
     active_reservations = cursor.fetchone()[0]
 
     cursor.execute('''
-        SELECT COUNT(*) FROM reservations WHERE status = 'completed'
-    ''')
-    completed_reservations = cursor.fetchone()[0]
-
-    cursor.execute('''
-        SELECT SUM(parking_cost) FROM reservations WHERE status = 'completed'
+        SELECT COALESCE(SUM(sessions), 0), COALESCE(SUM(revenue), 0) FROM lot_daily_stats
     ''')
-    total_revenue = cursor.fetchone()[0] or 0
+    completed_reservations, total_revenue = cursor.fetchone()
 
     cursor.execute('''
-        SELECT r.*, ps.id as spot_number, pl.prime_location_name, pl.price_per_hour, u.username, u.full_name,
-            CASE 
-                WHEN r.parking_timestamp IS NOT NULL AND r.leaving_timestamp IS NOT NULL
-                THEN (julianday(r.leaving_timestamp)-julianday(r.parking_timestamp)) * 24
-                ELSE 0
-            END as duration_hours
-        FROM reservations r
-        JOIN parking_spots as ps ON ps.id = r.spot_id
-        JOIN parking_lots pl ON ps.lot_id = pl.id
-        JOIN users u ON r.user_id = u.id
+        SELECT substr(ds.day, 1, 7) as month,
+            SUM(ds.sessions) as reservations,
+            SUM(ds.revenue) as revenue,
+            SUM(ds.duration_hours) as hours
+        FROM lot_daily_stats ds
+        JOIN parking_lots pl ON ds.lot_id = pl.id
         WHERE pl.is_active = 1
-        ORDER BY r.created_at DESC
+        GROUP BY month
+        ORDER BY month DESC
     ''')
 
-    all_reservations = [dict(row) for row in cursor.fetchall()]
-
-    monthly_stats = defaultdict(lambda: {'reservations': 0, 'revenue': 0, 'hours':0})
-    for reservation in all_reservations:
-        if reservation['created_at'] and reservation['status'] =='completed':
-            month_key = reservation['created_at'][:7]
-            monthly_stats[month_key]['reservations'] += 1
-            monthly_stats[month_key]['revenue'] += reservation['parking_cost'] or 0
-            monthly_stats[month_key]['hours'] += reservation['duration_hours'] or 0
+    monthly_stats = {row['month']: {'reservations': row['reservations'], 'revenue': row['revenue'], 'hours': row['hours']}
+                     for row in cursor.fetchall()}
 
+    # Every occupied spot holds exactly one active reservation, so a lot's
+    # total reservations is its completed sessions plus its occupied spots.
     cursor.execute('''
-        SELECT pl.prime_location_name, pl.id, 
-            COUNT(r.id) as total_reservations,
-            COUNT(CASE WHEN r.status = 'completed' THEN 1 END) as completed_session,
-            SUM(CASE WHEN r.status = 'completed' THEN r.parking_cost ELSE 0 END) as revenue,
-            AVG(CASE WHEN r.status = 'completed' AND r.parking_timestamp IS NOT NULL and r.leaving_timestamp IS NOT NULL
-                THEN (julianday(r.leaving_timestamp)-julianday(r.parking_timestamp)) * 24 ELSE NULL END) as avg_duration,
-            COUNT(ps.id) as total_spots,
-            SUM(CASE WHEN ps.status = 'O' THEN 1 ELSE 0 END) as occupied_spots
+        SELECT pl.prime_location_name, pl.id,
+            COALESCE(ds.sessions, 0) + pl.occupied_spots as total_reservations,
+            COALESCE(ds.sessions, 0) as completed_reservations,
+            COALESCE(ds.revenue, 0) as revenue,
+            CASE WHEN ds.sessions > 0 THEN ds.duration_hours / ds.sessions END as avg_duration,
+            pl.total_spots,
+            pl.occupied_spots
         FROM parking_lots pl
-        LEFT JOIN parking_spots ps ON pl.id = ps.lot_id
-        LEFT JOIN reservations r ON ps.id = r.spot_id
+        LEFT JOIN (
+            SELECT lot_id, SUM(sessions) as sessions, SUM(revenue) as revenue, SUM(duration_hours) as duration_hours
+            FROM lot_daily_stats
+            GROUP BY lot_id
+        ) ds ON ds.lot_id = pl.id
         WHERE pl.is_active = 1
-        GROUP BY pl.id, pl.prime_location_name
         ORDER BY revenue DESC
     ''')
 
@@ -758,23 +1233,39 @@ def get_admin_parking_summary():
 
     cursor.execute('''
         SELECT u.username, u.full_name,
-            COUNT(r.id) as total_reservations,
-            COUNT(CASE WHEN r.status = 'completed' THEN 1 END) as completed_sessions,
-            SUM(CASE WHEN r.status = 'completed' THEN r.parking_cost ELSE 0 END) as total_spent,
-            COUNT(CASE WHEN r.status IN ('reserved', 'occupied') THEN 1 END) as active_sessions
+            COALESCE(us.completed_sessions, 0) + COALESCE(a.active_sessions, 0) as total_reservations,
+            COALESCE(us.completed_sessions, 0) as completed_sessions,
+            COALESCE(us.total_spent, 0) as total_spent,
+            COALESCE(a.active_sessions, 0) as active_sessions
         FROM users u
-        LEFT JOIN reservations r ON u.id = r.user_id
-        GROUP BY u.id, u.username, u.full_name
-        HAVING total_reservations > 0
+        LEFT JOIN user_stats us ON us.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) as active_sessions FROM reservations
+            WHERE status IN ('reserved', 'occupied')
+            GROUP BY user_id
+        ) a ON a.user_id = u.id
+        WHERE us.user_id IS NOT NULL OR a.user_id IS NOT NULL
         ORDER BY total_spent DESC
     ''')
 
     user_activity = [dict(row) for row in cursor.fetchall()]
 
-    seven_days_ago = (datetime.now() - timedelta(days = 7)).strftime('%Y-%m-%d')
-    recent_reservations = [r for r in all_reservations if r['created_at'] and r['created_at']>=seven_days_ago]
+    seven_days_ago, seven_days_ago_epoch = analytics.days_ago(7)
+    cursor.execute('''
+        SELECT COALESCE(SUM(ds.sessions), 0), COALESCE(SUM(ds.revenue), 0)
+        FROM lot_daily_stats ds
+        JOIN parking_lots pl ON ds.lot_id = pl.id
+        WHERE ds.day >= ? AND pl.is_active = 1
+    ''', (seven_days_ago,))
+    recent_completed, recent_revenue = cursor.fetchone()
 
-    conn.close()
+    cursor.execute('''
+        SELECT COUNT(*) FROM reservations r
+        JOIN parking_spots ps ON r.spot_id = ps.id
+        JOIN parking_lots pl ON ps.lot_id = pl.id
+        WHERE r.status IN ('reserved', 'occupied') AND r.created_epoch >= ? AND pl.is_active = 1
+    ''', (seven_days_ago_epoch,))
+    recent_active = cursor.fetchone()[0]
 
     summary = {
         'basic_stats': {
@@ -788,16 +1279,44 @@ def get_admin_parking_summary():
             'total_revenue': total_revenue,
             'occupancy_rate': (occupied_spots / total_spots *100) if total_spots > 0 else 0
         },
-        'monthly_stats': dict(monthly_stats),
+        'monthly_stats': monthly_stats,
         'lot_performance': lot_performance,
         'user_activity': user_activity,
-        'recent_activity_7days': len(recent_reservations),
-        'recent_revenue_7days': sum(r['parking_cost'] or 0 for r in recent_reservations if r['status'] == 'completed'),
-        'all_reservations': all_reservations[:50]
+        'recent_activity_7days': recent_completed + recent_active,
+        'recent_revenue_7days': recent_revenue
     }
 
     return summary
 
+def get_recent_transactions(before=None, limit=ADMIN_TRANSACTIONS_PAGE_SIZE):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    keyset_filter = ""
+    params = []
+    if before:
+        keyset_filter = "AND (r.created_at, r.id) < (?, ?)"
+        params.extend(before)
+    params.append(limit)
+
+    cursor.execute(f'''
+        SELECT r.*, ps.id as spot_number, pl.prime_location_name, pl.price_per_hour, u.username, u.full_name,
+            CASE 
+                WHEN r.parking_epoch IS NOT NULL AND r.leaving_epoch IS NOT NULL
+                THEN (r.leaving_epoch - r.parking_epoch) / 3600.0
+                ELSE 0
+            END as duration_hours
+        FROM reservation_history r
+        JOIN parking_spots as ps ON ps.id = r.spot_id
+        JOIN parking_lots pl ON ps.lot_id = pl.id
+        JOIN users u ON r.user_id = u.id
+        WHERE pl.is_active = 1 {keyset_filter}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT ?
+    ''', params)
+
+    return [dict(row) for row in cursor.fetchall()]
+
 def calculate_parking_cost(parking_start_str, parking_end_str, price_per_hour, billing_method='hourly_rounded'):
     try:
         parking_start = datetime.fromisoformat(parking_start_str)
@@ -846,22 +1365,22 @@ def calculate_parking_cost(parking_start_str, parking_end_str, price_per_hour, b
     except Exception as e:
         return {'error': str(e), 'parking_cost': 0, 'duration_hours': 0}
 
-def get_current_parking_cost(reservation_id):
+def get_current_parking_cost(reservation_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
         cursor.execute('''
-            SELECT r.parking_timestamp, pl.price_per_hour, pl.prime_location_name
+            SELECT r.parking_timestamp, COALESCE(NULLIF(r.rate_at_booking, 0), pl.price_per_hour) as price_per_hour,
+                pl.prime_location_name
             FROM reservations r
             JOIN parking_spots ps ON r.spot_id = ps.id
             JOIN parking_lots pl ON ps.lot_id = pl.id
-            WHERE r.id = ? AND r.status = 'occupied'
-        ''', (reservation_id,))
+            WHERE r.id = ? AND r.user_id = ? AND r.status = 'occupied'
+        ''', (reservation_id, user_id))
         
         result = cursor.fetchone()
         if not result:
-            conn.close()
             return None
         
         result = dict(result)
@@ -874,13 +1393,25 @@ def get_current_parking_cost(reservation_id):
         )
         
         cost_details['location_name'] = result['prime_location_name']
-        conn.close()
         return cost_details
         
     except Exception as e:
-        conn.close()
+        conn.rollback()
         return None
 
+def add_current_parking_costs(reservations, current_time=None):
+    # Live cost for already-fetched reservation rows, at one shared "now" and
+    # the booked rate that end_parking will bill, without further queries.
+    current_time = current_time or get_current_timestamp()
+    for reservation in reservations:
+        if reservation['status'] != 'occupied' or not reservation['parking_timestamp']:
+            continue
+        cost_details = calculate_parking_cost(reservation['parking_timestamp'], current_time,
+                                              reservation['price_per_hour'])
+        if 'error' not in cost_details:
+            reservation['current_cost'] = cost_details
+    return reservations
+
 def format_duration(duration_hours):
     if duration_hours < 1:
         minutes = int(duration_hours * 60)
@@ -897,66 +1428,213 @@ def format_duration(duration_hours):
         remaining_hours = int(duration_hours % 24)
         return f"{days}d {remaining_hours}h"
 
-def get_cost_breakdown(user_id, time_period='all'):
+LIVE_COST_TICK_SECONDS = 60
+
+# How calculate_parking_cost bills each method, published with live costs so
+# clients can extrapolate between polls instead of asking every second.
+BILLING_RULES = {
+    'hourly_rounded': {'minimum_hours': 1, 'round_up_to_hours': 1},
+    'minimum_hour': {'minimum_hours': 1, 'round_up_to_hours': 0},
+    'minute_precise': {'minimum_hours': 0.25, 'round_up_to_hours': 0},
+}
+
+def live_costs_etag(reservations):
+    # Changes only when a reservation is booked, started, ended or cancelled;
+    # a client holding the current version extrapolates the cost itself.
+    state = [(r['id'], r['status'], r['parking_timestamp'], r['price_per_hour']) for r in reservations]
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+def live_cost_payload(reservation):
+    payload = {
+        'reservation_id': reservation['id'],
+        'status': reservation['status'],
+        'location_name': reservation['prime_location_name'],
+        'spot_number': reservation['spot_number'],
+        'parking_timestamp': reservation['parking_timestamp'],
+        'price_per_hour': reservation['price_per_hour'],
+        'billing_method': 'hourly_rounded',
+    }
+    cost_details = reservation.get('current_cost')
+    if cost_details:
+        payload.update({
+            'current_cost': cost_details['parking_cost'],
+            'billable_hours': cost_details['billable_hours'],
+            'duration_hours': cost_details['duration_hours'],
+            'duration_formatted': format_duration(cost_details['duration_hours']),
+            'billing_explanation': cost_details['billing_explanation'],
+        })
+    return payload
+
+def get_lot_spot_statuses(lot_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    date_filter = ""
-    if time_period == 'month':
-        date_filter = "AND r.created_at >= date('now', '-30 days')"
-    elif time_period == 'week':
-        date_filter = "AND r.created_at >= date('now', '-7 days')"
-    elif time_period == 'year':
-        date_filter = "AND r.created_at >= date('now', '-365 days')"
-    
-    cursor.execute(f'''
-        SELECT r.*, ps.id as spot_number, pl.prime_location_name, pl.price_per_hour,
-               CASE 
-                   WHEN r.parking_timestamp IS NOT NULL AND r.leaving_timestamp IS NOT NULL 
-                   THEN (julianday(r.leaving_timestamp) - julianday(r.parking_timestamp)) * 24
-                   ELSE 0
-               END as duration_hours
-        FROM reservations r
-        JOIN parking_spots ps ON r.spot_id = ps.id
-        JOIN parking_lots pl ON ps.lot_id = pl.id
-        WHERE r.user_id = ? AND r.status = 'completed' {date_filter}
-        ORDER BY r.created_at DESC
-    ''', (user_id,))
-    
-    reservations = [dict(row) for row in cursor.fetchall()]
-    
-    total_cost = sum(r['parking_cost'] or 0 for r in reservations)
-    total_hours = sum(r['duration_hours'] or 0 for r in reservations)
-    
-    location_costs = defaultdict(lambda: {'cost': 0, 'hours': 0, 'sessions': 0})
-    for r in reservations:
-        location = r['prime_location_name']
-        location_costs[location]['cost'] += r['parking_cost'] or 0
-        location_costs[location]['hours'] += r['duration_hours'] or 0
-        location_costs[location]['sessions'] += 1
-    
-    time_costs = defaultdict(lambda: {'cost': 0, 'hours': 0, 'sessions': 0})
-    for r in reservations:
-        if r['created_at']:
-            if time_period == 'year':
-                time_key = r['created_at'][:7]  # YYYY-MM
+
+    cursor.execute('''
+        SELECT total_spots, available_spots, occupied_spots FROM parking_lots WHERE id = ?
+    ''', (lot_id,))
+    counters = cursor.fetchone()
+    cursor.execute('''
+        SELECT id, status FROM parking_spots WHERE lot_id = ?
+    ''', (lot_id,))
+    return (dict(counters) if counters else None), dict(cursor.fetchall())
+
+def user_live_events(user_id, subscriber):
+    # Pushes a cost event whenever an occupied reservation's bill or
+    # displayed duration changes, and a reservation event on status changes.
+    # Costs are re-priced from the fetched rows, so ticks cost no queries;
+    # the shared cache version is checked only when the stream is idle, to
+    # pick up writes made by other worker processes.
+    conn = get_db_connection()
+    try:
+        version = get_cache_version(conn)
+        reservations = get_user_reservations(user_id)
+        sent = {}
+        while True:
+            wait = STREAM_KEEPALIVE_SECONDS
+            for reservation in add_current_parking_costs(reservations):
+                cost_details = reservation.get('current_cost')
+                if not cost_details:
+                    continue
+                payload = {
+                    'reservation_id': reservation['id'],
+                    'current_cost': cost_details['parking_cost'],
+                    'duration_formatted': format_duration(cost_details['duration_hours']),
+                    'billing_explanation': cost_details['billing_explanation'],
+                }
+                if sent.get(reservation['id']) != payload:
+                    sent[reservation['id']] = payload
+                    yield format_sse('cost', payload)
+                next_change = cost_details['billable_hours'] * 3600 - cost_details['duration_seconds']
+                wait = min(wait, LIVE_COST_TICK_SECONDS, max(next_change, 1))
+
+            try:
+                event_type, data = subscriber.get(timeout=wait)
+            except queue.Empty:
+                latest = get_cache_version(conn)
+                if latest == version:
+                    yield ": keepalive\n\n"
+                    continue
+                version = latest
+                previous = [(r['id'], r['status']) for r in reservations]
+                reservations = get_user_reservations(user_id)
+                if previous != [(r['id'], r['status']) for r in reservations]:
+                    yield format_sse('reservation', {})
+                continue
+
+            yield format_sse(event_type, data)
+            reservations = get_user_reservations(user_id)
+    finally:
+        event_broker.unsubscribe(('user', user_id), subscriber)
+
+def lot_live_events(lot_id, subscriber):
+    # Sends the lot's counters once, then one spot event per status change.
+    conn = get_db_connection()
+    try:
+        version = get_cache_version(conn)
+        counters, statuses = get_lot_spot_statuses(lot_id)
+        yield format_sse('occupancy', counters or {})
+        while True:
+            try:
+                event_type, data = subscriber.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                latest = get_cache_version(conn)
+                if latest == version:
+                    yield ": keepalive\n\n"
+                    continue
+                version = latest
+                event_type, data = 'resync', {}
+
+            if event_type == 'spot':
+                statuses[data['spot_id']] = data['status']
+                if 'total_spots' in data:
+                    counters = {key: data[key] for key in ('total_spots', 'available_spots', 'occupied_spots')}
+                yield format_sse(event_type, data)
+            elif event_type == 'resync':
+                # A write from another worker or a dropped backlog: diff
+                # against a fresh read and send only what changed.
+                latest_counters, latest_statuses = get_lot_spot_statuses(lot_id)
+                if latest_statuses.keys() != statuses.keys():
+                    yield format_sse('lot', {'lot_id': lot_id})
+                for spot_id, status in latest_statuses.items():
+                    if statuses.get(spot_id) != status:
+                        yield format_sse('spot', dict(latest_counters, spot_id=spot_id, status=status))
+                if latest_counters != counters:
+                    yield format_sse('occupancy', latest_counters or {})
+                counters, statuses = latest_counters, latest_statuses
             else:
-                time_key = r['created_at'][:10]  # YYYY-MM-DD
-            time_costs[time_key]['cost'] += r['parking_cost'] or 0
-            time_costs[time_key]['hours'] += r['duration_hours'] or 0
-            time_costs[time_key]['sessions'] += 1
-    
-    conn.close()
-    
+                yield format_sse(event_type, data)
+    finally:
+        event_broker.unsubscribe(('lot', lot_id), subscriber)
+
+def event_stream(topic, make_events):
+    # Subscribes before the response starts, so a worker already serving
+    # its limit of streams answers 503 instead of tying up another thread.
+    # The retry field is for clients that read it; browsers close a refused
+    # EventSource, and the pages schedule their own reconnect.
+    subscriber = event_broker.subscribe(topic)
+    if subscriber is None:
+        return Response(f'retry: {events.STREAM_RETRY_SECONDS * 1000}\n\n', status=503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(events.STREAM_RETRY_SECONDS)})
+    response = Response(make_events(subscriber), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The generators unsubscribe when they finish, but one closed before
+    # its first read never runs, so the slot is also freed here.
+    response.call_on_close(lambda: event_broker.unsubscribe(topic, subscriber))
+    return response
+
+def get_billing_comparison(columns, method_a, method_b, since=None, until=None):
+    # Per-lot revenue under two billing methods, from the column store.
+    import columnar
+
+    comparison = columnar.billing_comparison(columns, (method_a, method_b), since, until)
+    conn = get_db_connection()
+    names = {row['id']: row['prime_location_name'] for row in conn.execute('''
+        SELECT id, prime_location_name FROM parking_lots
+    ''')}
+
+    lots = []
+    for lot_id, data in comparison.items():
+        revenue_a = data['revenue'][method_a]
+        revenue_b = data['revenue'][method_b]
+        lots.append({
+            'lot_id': lot_id,
+            'name': names.get(lot_id, f'Lot {lot_id}'),
+            'sessions': data['sessions'],
+            'billed': data['billed'],
+            'revenue_a': revenue_a,
+            'revenue_b': revenue_b,
+            'difference': revenue_b - revenue_a,
+            'change_pct': (revenue_b - revenue_a) / revenue_a * 100 if revenue_a else 0,
+        })
+    lots.sort(key=lambda lot: abs(lot['difference']), reverse=True)
+
+    totals = {key: sum(lot[key] for lot in lots) for key in ('sessions', 'billed', 'revenue_a', 'revenue_b')}
+    totals['difference'] = totals['revenue_b'] - totals['revenue_a']
+    totals['change_pct'] = totals['difference'] / totals['revenue_a'] * 100 if totals['revenue_a'] else 0
+    return {'lots': lots, 'totals': totals}
+
+def get_cost_breakdown(user_id, time_period='all'):
+    since = analytics.period_start(time_period)
+
+    totals = analytics.session_totals(user_id, since=since)
+    total_cost = totals['cost']
+    total_hours = totals['hours']
+    total_sessions = totals['sessions']
+
+    location_costs = analytics.usage_by(user_id, 'location', since=since)
+    time_costs = analytics.usage_by(user_id, 'month' if time_period == 'year' else 'day', since=since)
+
+    reservations = analytics.recent_sessions(user_id, 20, since=since)
+
     return {
         'reservations': reservations,
         'total_cost': total_cost,
         'total_hours': total_hours,
-        'total_sessions': len(reservations),
-        'average_cost_per_session': total_cost / len(reservations) if reservations else 0,
+        'total_sessions': total_sessions,
+        'average_cost_per_session': total_cost / total_sessions if total_sessions else 0,
         'average_cost_per_hour': total_cost / total_hours if total_hours > 0 else 0,
-        'location_breakdown': dict(location_costs),
-        'time_breakdown': dict(time_costs),
+        'location_breakdown': location_costs,
+        'time_breakdown': time_costs,
         'time_period': time_period
     }
 
@@ -1098,11 +1776,13 @@ def admin_edit_lot(lot_id):
             if max_spots < occupied_count:
                 flash(f'Cannot reduce spots below {occupied_count}. There are currently {occupied_count} occupied/reserved spots.', 'error')
             else:
-                if update_parking_lot(lot_id, location_name, address, pin_code, price_per_hour, max_spots):
-                    flash('Parking lot updated successfully!', 'success')
+                success, message = update_parking_lot(lot_id, location_name, address, pin_code, price_per_hour,
+                                                      max_spots)
+                if success:
+                    flash(message, 'success')
                     return redirect(url_for('admin_lots'))
                 else:
-                    flash('Error updating parking lot! Please try again.', 'error')
+                    flash(message, 'error')
     
     lot, spots = get_parking_lot_details(lot_id)
     if not lot:
@@ -1145,7 +1825,8 @@ def admin_users():
     if auth_check:
         return auth_check
     
-    users = get_all_users()
+    with report_slot(admin_report_bulkhead):
+        users = get_all_users()
     return render_template('admin_users.html', users=users)
 
 @app.route('/admin/summary')
@@ -1154,10 +1835,73 @@ def admin_summary():
     if auth_check:
         return auth_check
     
-    summary = get_admin_parking_summary()
-    return render_template('admin_summary.html', summary = summary)
+    page_size = parse_page_size(request.args.get('page_size'), ADMIN_TRANSACTIONS_PAGE_SIZE)
+    before = parse_page_cursor(request.args.get('cursor'))
+    with report_slot(admin_report_bulkhead):
+        summary = get_admin_parking_summary()
+        transactions, next_cursor = split_page(get_recent_transactions(before, page_size + 1), page_size)
+
+    return render_template('admin_summary.html', summary = summary, transactions=transactions,
+                           next_cursor=next_cursor, page_size=page_size, is_first_page=before is None)
 
 
+@app.route('/admin/slow_queries')
+def admin_slow_queries():
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+
+    entries = slowlog.read_recent()
+    return render_template('admin_slow_queries.html', statements=slowlog.summarize(entries), entries=entries[:50],
+                           threshold_ms=None if slowlog.threshold is None else slowlog.threshold * 1000,
+                           log_path=slowlog.SLOW_QUERY_LOG_PATH)
+
+@app.route('/admin/billing_comparison')
+def admin_billing_comparison():
+    auth_check = require_admin()
+    if auth_check:
+        return auth_check
+
+    try:
+        import columnar
+    except ImportError:
+        flash('The billing comparison needs numpy installed on the server', 'error')
+        return redirect(url_for('admin_summary'))
+
+    method_a = request.args.get('method_a', 'hourly_rounded')
+    method_b = request.args.get('method_b', 'minute_precise')
+    since = request.args.get('since', '')
+    until = request.args.get('until', '')
+    if method_a not in BILLING_RULES or method_b not in BILLING_RULES:
+        flash('Unknown billing method', 'error')
+        return redirect(url_for('admin_billing_comparison'))
+
+    try:
+        # The range is by booking day, inclusive of both ends, like the rollups.
+        since_epoch = columnar.day_start(since) if since else None
+        until_epoch = columnar.day_start(until) + 86400 if until else None
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('admin_billing_comparison'))
+
+    meta = columnar.read_meta()
+    try:
+        columns = columnar.load_columns(meta=meta)
+    except FileNotFoundError:
+        # Written before the rate column existed; the next export rebuilds it.
+        flash('The column store is out of date; run "python manage.py export-columns"', 'error')
+        meta, columns = {'rows': 0}, columnar.load_columns(meta={'rows': 0})
+    with report_slot(admin_report_bulkhead):
+        comparison = get_billing_comparison(columns, method_a, method_b, since_epoch, until_epoch)
+
+    exported_at = None
+    if meta.get('exported_at'):
+        exported_at = datetime.fromtimestamp(meta['exported_at'], IST).strftime('%Y-%m-%d %H:%M:%S')
+
+    return render_template('admin_billing_comparison.html', comparison=comparison, methods=list(BILLING_RULES),
+                           method_a=method_a, method_b=method_b, since=since, until=until,
+                           exported_rows=meta['rows'], exported_at=exported_at)
+
 @app.route('/user_dashboard')
 def user_dashboard():
     auth_check = require_user()
@@ -1167,12 +1911,12 @@ def user_dashboard():
     active_reservations = get_user_reservations(session['user_id'], include_completed=False)
     
     available_lots = get_available_parking_lots()
-
-    for reservation in active_reservations:
-        if reservation['status'] == 'occupied':
-            current_cost = get_current_parking_cost(reservation['id'])
-            if current_cost:
-                reservation['current_cost'] = current_cost
+    add_current_parking_costs(active_reservations)
+    if hold_scheduler.timeout:
+        for reservation in active_reservations:
+            if reservation['status'] == 'reserved':
+                expires = reservation['created_epoch'] + hold_scheduler.timeout
+                reservation['hold_expires_at'] = datetime.fromtimestamp(expires, IST).strftime('%H:%M')
 
     return render_template('user_dashboard.html', active_reservations=active_reservations, available_lots=available_lots)
 
@@ -1242,9 +1986,15 @@ def user_history():
     if auth_check:
         return auth_check
     
-    reservations = get_user_reservations(session['user_id'], include_completed=True)
+    page_size = parse_page_size(request.args.get('page_size'), HISTORY_PAGE_SIZE)
+    before = parse_page_cursor(request.args.get('cursor'))
+    reservations, next_cursor = split_page(
+        get_user_reservations(session['user_id'], include_completed=True, before=before, limit=page_size + 1),
+        page_size)
+    stats = get_user_history_stats(session['user_id'])
 
-    return render_template('user_history.html', reservations=reservations)
+    return render_template('user_history.html', reservations=reservations, stats=stats,
+                           next_cursor=next_cursor, page_size=page_size, is_first_page=before is None)
 
 @app.route('/user/summary')
 def user_summary():
@@ -1252,7 +2002,8 @@ def user_summary():
     if auth_check:
         return auth_check
     
-    summary = get_user_parking_summary(session['user_id'])
+    with report_slot(user_report_bulkhead):
+        summary = get_user_parking_summary(session['user_id'])
     return render_template('user_summary.html', summary=summary)
 
 @app.route('/user/cost_breakdown')
@@ -1262,7 +2013,8 @@ def user_cost_breakdown():
         return auth_check
     
     time_period = request.args.get('period', 'all')
-    breakdown = get_cost_breakdown(session['user_id'], time_period)
+    with report_slot(user_report_bulkhead):
+        breakdown = get_cost_breakdown(session['user_id'], time_period)
     
     return render_template('user_cost_breakdown.html', breakdown=breakdown)
 
@@ -1272,7 +2024,7 @@ def api_current_cost(reservation_id):
     if auth_check:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    cost_details = get_current_parking_cost(reservation_id)
+    cost_details = get_current_parking_cost(reservation_id, session['user_id'])
     if cost_details:
         return jsonify({
             'current_cost': cost_details['parking_cost'],
@@ -1283,5 +2035,68 @@ def api_current_cost(reservation_id):
     else:
         return jsonify({'error': 'Reservation not found'}), 404
 
+@app.route('/api/current_costs')
+def api_current_costs():
+    auth_check = require_user()
+    if auth_check:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    reservations = get_user_reservations(session['user_id'])
+    etag = live_costs_etag(reservations)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        current_time = get_current_timestamp()
+        add_current_parking_costs(reservations, current_time)
+        response = jsonify({
+            'server_time': current_time,
+            'billing_rules': BILLING_RULES,
+            'reservations': [live_cost_payload(r) for r in reservations],
+        })
+
+    # Clients must revalidate, but an unchanged set of reservations costs
+    # one indexed query and an empty 304.
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    token_ok = METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if not token_ok and not is_admin():
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+
+    extra_counters = [
+        ('parking_query_cache_events_total', 'Read-through cache lookups and evictions.',
+         {(('event', event),): count for event, count in query_cache.stats.items()}),
+        ('parking_reserve_attempts_total', 'Reservation transaction attempts, including retries.',
+         {(('kind', kind),): count for kind, count in reserve_stats.items()}),
+        ('parking_event_streams_total', 'Live event streams opened, and refused at the per-process limit.',
+         {(('outcome', outcome),): count for outcome, count in event_broker.stats.items()}),
+        ('parking_hold_expiry_total', 'Reservation holds scheduled and expired, expiry batches and failed batches.',
+         {(('event', event),): count for event, count in hold_scheduler.stats.items()}),
+        ('parking_bulkhead_requests_total', 'Requests admitted, queued or refused by each bulkhead.',
+         {(('bulkhead', limiter.name), ('outcome', outcome)): count
+          for limiter in (admin_report_bulkhead, user_report_bulkhead) for outcome, count in limiter.stats.items()}),
+    ]
+    return Response(metrics.metrics_registry.render(extra_counters), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stream/user')
+def api_stream_user():
+    auth_check = require_user()
+    if auth_check:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_id = session['user_id']
+    return event_stream(('user', user_id), lambda subscriber: user_live_events(user_id, subscriber))
+
+@app.route('/api/stream/lot/<int:lot_id>')
+def api_stream_lot(lot_id):
+    auth_check = require_admin()
+    if auth_check:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return event_stream(('lot', lot_id), lambda subscriber: lot_live_events(lot_id, subscriber))
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
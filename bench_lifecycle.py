@@ -0,0 +1,228 @@
+"""Load-test the parking lifecycle and report per-route latency as JSON.
+
+Usage: python bench_lifecycle.py [--users 100] [--cycles 5] [--lots 5] [--spots 40]
+                                 [--admins 2] [--cancel-ratio 0.2] [--seed 1]
+                                 [--url http://127.0.0.1:8000] [--output run.json]
+
+Each simulated user logs in and repeats reserve -> start -> end (or reserve
+-> cancel), following every redirect back to the dashboard as a browser
+would, while admins keep polling /admin/summary and /admin_dashboard.
+Without --url the app runs in-process through the Flask test client against
+a throwaway database; with --url a running server is driven over HTTP and
+the default admin account is used to create the benchmark lots. Compare
+runs made the same way; in-process numbers include the client's own work.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'admin123'
+ADMIN_POLL_PATHS = [('admin_summary', '/admin/summary'), ('admin_dashboard', '/admin_dashboard')]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+class HttpSession:
+    # Redirects are not followed, so each hop is timed as its own route.
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), self._NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+class Client:
+    def __init__(self, session, recorder):
+        self.session = session
+        self.recorder = recorder
+
+    def call(self, route, method, path, data=None, expect=(200, 302, 304)):
+        started = time.perf_counter()
+        status, body = self.session.request(method, path, data)
+        self.recorder.add(route, time.perf_counter() - started, status in expect)
+        return status, body
+
+    def get(self, route, path, **kwargs):
+        return self.call(route, 'GET', path, **kwargs)
+
+    def post(self, route, path, data, **kwargs):
+        return self.call(route, 'POST', path, data, **kwargs)
+
+def active_reservation(client):
+    status, body = client.get('api_current_costs', '/api/current_costs')
+    if status != 200:
+        return None
+    reservations = json.loads(body)['reservations']
+    return reservations[0] if reservations else None
+
+def run_user(client, username, password, cycles, cancel_ratio, rng, outcomes, lock):
+    client.post('login', '/login', {'username': username, 'password': password, 'user_type': 'user'})
+    _, body = client.get('user_dashboard', '/user_dashboard')
+    lot_ids = sorted(set(int(i) for i in re.findall(rb'/user/reserve/(\d+)', body)))
+
+    for _ in range(cycles):
+        if not lot_ids:
+            outcome = 'no_lots'
+        else:
+            client.get('user_reserve_spot', f'/user/reserve/{rng.choice(lot_ids)}')
+            client.get('user_dashboard', '/user_dashboard')
+            reservation = active_reservation(client)
+            if reservation is None:
+                outcome = 'reserve_failed'
+            elif rng.random() < cancel_ratio:
+                client.get('user_cancel_reservation', f"/user/cancel/{reservation['reservation_id']}")
+                client.get('user_dashboard', '/user_dashboard')
+                outcome = 'cancelled'
+            else:
+                client.get('user_start_parking', f"/user/start_parking/{reservation['reservation_id']}")
+                client.get('user_dashboard', '/user_dashboard')
+                client.get('user_end_parking', f"/user/end_parking/{reservation['reservation_id']}")
+                client.get('user_dashboard', '/user_dashboard')
+                outcome = 'completed'
+        with lock:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+def run_admin(client, stop):
+    client.post('login', '/login', {'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD, 'user_type': 'admin'})
+    while not stop.is_set():
+        for route, path in ADMIN_POLL_PATHS:
+            client.get(route, path, expect=(200,))
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(recorder, elapsed):
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(route, 0),
+            'throughput_rps': round(len(values) / elapsed, 1),
+            'mean_ms': round(statistics.fmean(values) * 1000, 3),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3),
+        }
+    return routes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100, help="Concurrent simulated users")
+    parser.add_argument('--cycles', type=int, default=5, help="Reservations per user")
+    parser.add_argument('--lots', type=int, default=5)
+    parser.add_argument('--spots', type=int, default=40, help="Spots per lot")
+    parser.add_argument('--admins', type=int, default=2, help="Admins polling the summary pages")
+    parser.add_argument('--cancel-ratio', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help="Benchmark a running server instead of the in-process app")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.url:
+        make_session = lambda: HttpSession(args.url)
+    else:
+        workdir = tempfile.mkdtemp(prefix='parking_bench_')
+        from app import create_app
+        # create_app builds the schema and default admin in the throwaway database.
+        app = create_app({'DB_PATH': os.path.join(workdir, 'bench.db')})
+        make_session = lambda: TestClientSession(app)
+
+    recorder = Recorder()
+    setup = Client(make_session(), Recorder())
+    setup.post('login', '/login', {'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD, 'user_type': 'admin'})
+    for i in range(args.lots):
+        setup.post('admin_add_lot', '/admin/lots/add', {
+            'location_name': f'Bench Lot {i + 1}', 'address': f'{i + 1} Bench Road', 'pin_code': '560001',
+            'price_per_hour': str(10 + 5 * (i % 4)), 'max_spots': str(args.spots)})
+
+    run_tag = f'{int(time.time())}{os.getpid()}'
+    password = 'benchpass'
+    users = [f'bench{run_tag}_{i}' for i in range(args.users)]
+    for username in users:
+        setup.post('register', '/register', {
+            'username': username, 'email': f'{username}@example.com', 'full_name': username,
+            'password': password, 'confirm_password': password})
+
+    outcomes = {}
+    outcomes_lock = threading.Lock()
+    stop_admins = threading.Event()
+    rng = random.Random(args.seed)
+    user_threads = [threading.Thread(target=run_user, args=(
+        Client(make_session(), recorder), username, password, args.cycles, args.cancel_ratio,
+        random.Random(rng.random()), outcomes, outcomes_lock)) for username in users]
+    admin_threads = [threading.Thread(target=run_admin, args=(Client(make_session(), recorder), stop_admins))
+                     for _ in range(args.admins)]
+
+    started = time.perf_counter()
+    for thread in admin_threads + user_threads:
+        thread.start()
+    for thread in user_threads:
+        thread.join()
+    stop_admins.set()
+    for thread in admin_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total_requests = sum(len(values) for values in recorder.latencies.values())
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'elapsed_seconds': round(elapsed, 3),
+        'total_requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 1),
+        'lifecycles': outcomes,
+        'routes': summarize(recorder, elapsed),
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return 1 if any(recorder.errors.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import threading
+
+
+ADMIN_REPORT_CONCURRENCY = 2
+USER_REPORT_CONCURRENCY = 2
+REPORT_WAIT_SECONDS = 2
+
+class Bulkhead:
+    """Caps how many worker threads one class of request may occupy.
+
+    At most `limit` requests run at once. Others wait up to `timeout`
+    seconds for a slot and are refused after that. A burst of slow reports
+    therefore cannot take every thread of a worker for longer than the
+    wait, and reservations and other short requests keep being served.
+    """
+
+    def __init__(self, name, limit, timeout=0):
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self.stats = {'admitted': 0, 'waited': 0, 'rejected': 0}
+        self._semaphore = threading.Semaphore(limit)
+        self._stats_lock = threading.Lock()
+
+    def configure(self, limit=None, timeout=None):
+        # Only while no request holds a slot, i.e. from create_app.
+        if limit is not None:
+            self.limit = limit
+            self._semaphore = threading.Semaphore(limit)
+        if timeout is not None:
+            self.timeout = timeout
+
+    def _count(self, outcome):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+
+    def acquire(self):
+        if not self._semaphore.acquire(blocking=False):
+            self._count('waited')
+            if not self._semaphore.acquire(timeout=self.timeout):
+                self._count('rejected')
+                return False
+        self._count('admitted')
+        return True
+
+    def release(self):
+        self._semaphore.release()
+
+# Admin and user report pages get separate pools, so neither can crowd
+# the other out.
+admin_report_bulkhead = Bulkhead('admin_reports', ADMIN_REPORT_CONCURRENCY, REPORT_WAIT_SECONDS)
+user_report_bulkhead = Bulkhead('user_reports', USER_REPORT_CONCURRENCY, REPORT_WAIT_SECONDS)
@@ -0,0 +1,78 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_db_connection
+
+
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 30
+
+class QueryCache:
+    """LRU cache of query results tagged with the shared cache version.
+
+    Every write that can change a cached result bumps cache_version in its
+    own transaction, so an entry is served only while the version it was
+    computed under is still current. The version lives in the database, which
+    keeps several worker processes in step; the TTL bounds results that also
+    depend on the clock, such as "last 7 days" figures.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return True, value
+                del self._entries[key]
+            self.stats['misses'] += 1
+            return False, None
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+query_cache = QueryCache()
+
+def get_cache_version(conn):
+    return conn.execute('SELECT version FROM cache_version WHERE id = 1').fetchone()[0]
+
+def bump_cache_version(cursor):
+    # Call in the same transaction as the write, so readers in any process
+    # never see the new data with the old version.
+    cursor.execute('UPDATE cache_version SET version = version + 1 WHERE id = 1')
+
+def cached_query(func):
+    # Results are shared between requests; callers must treat them as read-only.
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (func.__name__,) + args
+        # Read the version before computing, so a write that lands meanwhile
+        # leaves the entry tagged stale rather than hiding the change.
+        version = get_cache_version(get_db_connection())
+        hit, value = query_cache.get(key, version)
+        if hit:
+            return value
+        value = func(*args)
+        query_cache.set(key, version, value)
+        return value
+    return wrapper
@@ -0,0 +1,314 @@
+"""Columnar export of completed reservations for fleet-wide reports.
+
+Completed sessions are copied out of SQLite into one memory-mapped .npy
+file per column, and reports are answered with vectorized NumPy over those
+arrays instead of loading rows into Python. Requires numpy, which the web
+app itself does not need.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+import eventlog
+from db import get_db_connection
+
+
+COLUMN_STORE_DIR = 'reservation_columns'
+EXPORT_CHUNK_ROWS = 100_000
+BILLING_CHUNK_ROWS = 1_000_000
+BILLING_METHODS = ('hourly_rounded', 'minute_precise', 'minimum_hour')
+
+# Stored timestamps are IST wall-clock text; columns hold real UTC epochs and
+# shift back by this offset when bucketing by calendar month or day.
+IST_OFFSET_SECONDS = 5 * 3600 + 30 * 60
+
+COLUMNS = {
+    'id': np.int64,
+    'lot_id': np.int64,
+    'user_id': np.int64,
+    'created': np.int64,
+    'start': np.int64,
+    'end': np.int64,
+    'cost': np.float64,
+    'rate': np.float64,
+}
+
+def _meta_path(store_dir):
+    return os.path.join(store_dir, 'meta.json')
+
+def _column_path(store_dir, name):
+    return os.path.join(store_dir, f'{name}.npy')
+
+def read_meta(store_dir=COLUMN_STORE_DIR):
+    try:
+        with open(_meta_path(store_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'rows': 0, 'event_offset': None}
+
+def _consumer(store_dir):
+    # Each store is its own consumer of the event log.
+    return 'columns:' + os.path.abspath(store_dir)
+
+def _write_meta(store_dir, meta):
+    with open(_meta_path(store_dir) + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(_meta_path(store_dir) + '.tmp', _meta_path(store_dir))
+
+SESSION_ROWS = '''
+    SELECT r.id, ps.lot_id, r.user_id,
+        COALESCE(r.created_epoch, 0),
+        COALESCE(r.parking_epoch, 0),
+        COALESCE(r.leaving_epoch, 0),
+        COALESCE(r.parking_cost, 0),
+        COALESCE(NULLIF(r.rate_at_booking, 0), pl.price_per_hour)
+    FROM reservation_history r
+    JOIN parking_spots ps ON r.spot_id = ps.id
+    JOIN parking_lots pl ON ps.lot_id = pl.id
+'''
+
+def _history_chunks(conn):
+    cursor = conn.execute(SESSION_ROWS + "WHERE r.status = 'completed' ORDER BY r.id")
+    while True:
+        chunk = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not chunk:
+            return
+        yield chunk
+
+def _ended_chunks(conn, consumer, until):
+    events = eventlog.read_from(consumer, until, ('ended',), EXPORT_CHUNK_ROWS, conn)
+    while events:
+        ids = json.dumps([event['reservation_id'] for event in events])
+        yield conn.execute(SESSION_ROWS + 'WHERE r.id IN (SELECT value FROM json_each(?))', (ids,)).fetchall()
+        events = eventlog.read_events(events[-1]['id'], until, ('ended',), EXPORT_CHUNK_ROWS, conn)
+
+def _commit_offset(conn, consumer, event_offset):
+    # Committed after meta.json is written; if an export stops in between,
+    # the two disagree and the next export rebuilds the store.
+    eventlog.commit(consumer, event_offset, conn)
+    conn.commit()
+
+def export_completed_reservations(store_dir=COLUMN_STORE_DIR, full=False):
+    """Append reservations completed since the last export to the store.
+
+    After the first full export this consumes 'ended' events from the
+    reservation event log, so sessions are picked up in the order they
+    finished. How far it has read is committed to consumer_offsets and
+    also kept as meta['event_offset'], next to the files it describes.
+    Existing rows are copied file-to-file rather than re-read from SQLite.
+    Column files are replaced before meta.json, so readers that slice to
+    meta['rows'] always see a consistent prefix.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    meta = read_meta(store_dir)
+    conn = get_db_connection()
+    consumer = _consumer(store_dir)
+    # A store written before a column existed, or whose files are not at the
+    # committed offset, is rebuilt in full.
+    if meta.get('event_offset') != eventlog.committed_offset(consumer, conn) \
+            or not all(os.path.exists(_column_path(store_dir, name)) for name in COLUMNS):
+        full = True
+    if full:
+        meta = {'rows': 0, 'event_offset': 0}
+
+    # One read transaction, so the counts, the scans and the new offset all
+    # come from the same snapshot and no session is skipped or exported twice.
+    conn.execute('BEGIN')
+    try:
+        event_offset = eventlog.latest_event_id(conn)
+        if full:
+            new_rows = conn.execute('''
+                SELECT COUNT(*) FROM reservation_history WHERE status = 'completed'
+            ''').fetchone()[0]
+            chunks = _history_chunks(conn)
+        else:
+            new_rows = conn.execute('''
+                SELECT COUNT(*) FROM reservation_events WHERE event_type = 'ended' AND id > ? AND id <= ?
+            ''', (meta['event_offset'], event_offset)).fetchone()[0]
+            chunks = _ended_chunks(conn, consumer, event_offset)
+
+        if new_rows == 0 and not full:
+            conn.rollback()
+            if event_offset != meta['event_offset']:
+                _write_meta(store_dir, dict(meta, event_offset=event_offset))
+                _commit_offset(conn, consumer, event_offset)
+            return 0
+
+        total_rows = meta['rows'] + new_rows
+        columns = {name: np.lib.format.open_memmap(_column_path(store_dir, name) + '.tmp', mode='w+',
+                                                    dtype=dtype, shape=(total_rows,))
+                   for name, dtype in COLUMNS.items()}
+
+        if meta['rows']:
+            existing = load_columns(store_dir, meta)
+            for name in COLUMNS:
+                columns[name][:meta['rows']] = existing[name]
+
+        position = meta['rows']
+        for chunk in chunks:
+            for name, values in zip(COLUMNS, zip(*chunk)):
+                columns[name][position:position + len(chunk)] = values
+            position += len(chunk)
+    finally:
+        conn.rollback()
+
+    for array in columns.values():
+        array.flush()
+    columns.clear()
+    for name in COLUMNS:
+        os.replace(_column_path(store_dir, name) + '.tmp', _column_path(store_dir, name))
+
+    _write_meta(store_dir, {'rows': position, 'event_offset': event_offset, 'exported_at': int(time.time())})
+    _commit_offset(conn, consumer, event_offset)
+    return position - meta['rows']
+
+def load_columns(store_dir=COLUMN_STORE_DIR, meta=None):
+    meta = meta or read_meta(store_dir)
+    rows = meta['rows']
+    if rows == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    return {name: np.load(_column_path(store_dir, name), mmap_mode='r')[:rows] for name in COLUMNS}
+
+def _group_sums(keys, *values):
+    # Returns the distinct keys, a count per key, and the sum of each value per
+    # key. Keys are dense integers (ids, month or day numbers), so bincount
+    # over the key range replaces a sort-based group-by.
+    if len(keys) == 0:
+        return keys, np.zeros(0, dtype=np.int64), [np.zeros(0) for _ in values]
+    offset = keys.min()
+    index = keys - offset
+    counts = np.bincount(index)
+    present = np.flatnonzero(counts)
+    sums = [np.bincount(index, weights=value)[present] for value in values]
+    return present + offset, counts[present], sums
+
+def _group_by_period(epochs, unit, *values):
+    # Groups by IST calendar day with integer arithmetic; months are then
+    # rolled up from the few distinct days rather than converted per row.
+    days, counts, sums = _group_sums((epochs + IST_OFFSET_SECONDS) // 86400, *values)
+    if unit == 'D' or len(days) == 0:
+        return days, counts, sums
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    months, _, (counts, *sums) = _group_sums(months, counts, *sums)
+    return months, counts.astype(np.int64), sums
+
+def day_start(day):
+    # Epoch of IST midnight starting a 'YYYY-MM-DD' day, for since/until filters.
+    return int(np.datetime64(day, 's').astype(np.int64)) - IST_OFFSET_SECONDS
+
+def _period_label(number, unit):
+    return str(np.datetime64(int(number), unit))
+
+def _select(columns, since=None, until=None):
+    # Returns the columns restricted to the matching rows; with no filters
+    # the memory-mapped arrays are used as they are, without a copy.
+    mask = None
+    for condition in (
+        None if since is None else columns['created'] >= since,
+        None if until is None else columns['created'] < until,
+    ):
+        if condition is not None:
+            mask = condition if mask is None else mask & condition
+    if mask is None:
+        return columns
+    return {name: column[mask] for name, column in columns.items()}
+
+def _hours(columns):
+    return (columns['end'] - columns['start']) / 3600
+
+def revenue_by_month(columns, since=None, until=None):
+    selected = _select(columns, since, until)
+    months, counts, (revenue, hours) = _group_by_period(
+        selected['created'], 'M', selected['cost'], _hours(selected))
+    return {_period_label(month, 'M'): {'reservations': int(count), 'revenue': float(rev), 'hours': float(h)}
+            for month, count, rev, h in zip(months[::-1], counts[::-1], revenue[::-1], hours[::-1])}
+
+def revenue_by_lot(columns, since=None, until=None):
+    selected = _select(columns, since, until)
+    lots, counts, (revenue, hours) = _group_sums(selected['lot_id'], selected['cost'], _hours(selected))
+    return {int(lot): {'sessions': int(count), 'revenue': float(rev), 'avg_duration': float(h / count)}
+            for lot, count, rev, h in zip(lots, counts, revenue, hours)}
+
+def duration_percentiles(columns, percentiles=(50, 90, 95, 99), since=None, until=None):
+    selected = _select(columns, since, until)
+    seconds = selected['end'] - selected['start']
+    if len(seconds) == 0:
+        return {p: 0.0 for p in percentiles}
+    return dict(zip(percentiles, (float(v) / 3600 for v in np.percentile(seconds, percentiles))))
+
+def user_totals(columns, top=None, since=None, until=None):
+    selected = _select(columns, since, until)
+    users, counts, (spent,) = _group_sums(selected['user_id'], selected['cost'])
+    if top and top < len(spent):
+        order = np.argpartition(spent, -top)[-top:]
+        order = order[np.argsort(spent[order])[::-1]]
+    else:
+        order = np.argsort(spent)[::-1]
+    return [{'user_id': int(users[i]), 'sessions': int(counts[i]), 'total_spent': float(spent[i])} for i in order]
+
+def _seconds(values):
+    values = np.asarray(values)
+    if values.dtype.kind in 'iuf':
+        return values.astype(np.float64)
+    # Stored timestamps and datetime64 values; only differences are used,
+    # so the IST offset cancels out.
+    return values.astype('datetime64[s]').astype(np.int64).astype(np.float64)
+
+def _billable_hours(seconds, method):
+    # Mirrors calculate_parking_cost's branches, including its arithmetic.
+    hours = seconds / 3600
+    if method == 'hourly_rounded':
+        return np.where(hours <= 1, 1.0, np.ceil(hours))
+    if method == 'minute_precise':
+        return np.maximum(seconds / 60, 15) / 60
+    if method == 'minimum_hour':
+        return np.where(hours <= 1, 1.0, hours)
+    raise ValueError(f"Unknown billing method: {method}")
+
+def bill_sessions(start, end, rate, methods=BILLING_METHODS):
+    """Price many sessions under several billing methods in one pass.
+
+    start and end are arrays of epoch seconds, datetime64 values or stored
+    timestamp strings; rate is the hourly rate, a scalar or an array. Returns
+    {method: (cost, billable_hours)}, matching calculate_parking_cost row for
+    row.
+    """
+    seconds = _seconds(end) - _seconds(start)
+    rate = np.asarray(rate, dtype=np.float64)
+    billed = {}
+    for method in methods:
+        billable_hours = _billable_hours(seconds, method)
+        billed[method] = (billable_hours * rate, billable_hours)
+    return billed
+
+def billing_comparison(columns, methods=BILLING_METHODS, since=None, until=None):
+    """Per-lot revenue had the selected sessions been billed by each method.
+
+    Returns {lot_id: {'sessions', 'billed', 'revenue': {method: total}}},
+    where 'billed' is what was actually charged. Sessions are priced in
+    chunks so memory stays bounded on the full history.
+    """
+    selected = _select(columns, since, until)
+    lot_ids = selected['lot_id']
+    if len(lot_ids) == 0:
+        return {}
+    offset = int(lot_ids.min())
+    size = int(lot_ids.max()) - offset + 1
+
+    counts = np.zeros(size, dtype=np.int64)
+    billed = np.zeros(size)
+    revenue = {method: np.zeros(size) for method in methods}
+    for i in range(0, len(lot_ids), BILLING_CHUNK_ROWS):
+        chunk = slice(i, i + BILLING_CHUNK_ROWS)
+        index = lot_ids[chunk] - offset
+        counts += np.bincount(index, minlength=size)
+        billed += np.bincount(index, weights=selected['cost'][chunk], minlength=size)
+        priced = bill_sessions(selected['start'][chunk], selected['end'][chunk], selected['rate'][chunk], methods)
+        for method, (cost, _) in priced.items():
+            revenue[method] += np.bincount(index, weights=cost, minlength=size)
+
+    return {int(i) + offset: {'sessions': int(counts[i]), 'billed': float(billed[i]),
+                              'revenue': {method: float(revenue[method][i]) for method in methods}}
+            for i in np.flatnonzero(counts)}
@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import queue
+from flask import g, has_app_context
+from metrics import InstrumentedConnection
+
+
+DB_PATH = "parking_app.db"
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+# Bumped by configure(), so per-thread connections made under the old
+# settings are replaced the next time their thread asks for one.
+_generation = 0
+
+def _connect():
+    # Connections are handed between request threads through the pool, so
+    # sqlite's same-thread check is disabled; the pool guarantees exclusive use.
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, factory=InstrumentedConnection,
+                           cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+def _checkout():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+def _checkin(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def configure(db_path=None, pool_size=None, busy_timeout_ms=None):
+    # Applied by create_app before any request; connections already open
+    # were made with the old settings, so they are closed.
+    global DB_PATH, POOL_SIZE, BUSY_TIMEOUT_MS, _pool, _generation
+    close_all()
+    _generation += 1
+    if db_path is not None:
+        DB_PATH = db_path
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if busy_timeout_ms is not None:
+        BUSY_TIMEOUT_MS = busy_timeout_ms
+    _pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+def close_all():
+    # Closes the pooled connections and this thread's own connection, e.g.
+    # before a prefork server forks workers, since SQLite connections must
+    # not be carried across fork().
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def get_db_connection():
+    # Inside a request the same pooled connection is reused by every helper
+    # and returned at teardown; scripts and background threads keep one
+    # long-lived connection per thread instead.
+    if has_app_context():
+        if 'db' not in g:
+            g.db = _checkout()
+        return g.db
+
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'generation', None) != _generation:
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+    return conn
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        _checkin(conn)
@@ -0,0 +1,69 @@
+from db import get_db_connection
+
+
+# reservation_events is an append-only record of every reservation state
+# change, written in the same transaction as the change itself. Consumers
+# read it in id order and keep the id of the last event they applied as
+# their offset in consumer_offsets, committed in the same transaction as
+# whatever they produce from those events so the two always advance together.
+
+EVENT_TYPES = ('reserved', 'started', 'ended', 'cancelled')
+EVENT_BATCH_SIZE = 10_000
+
+def append_event(cursor, event_type, reservation_id, lot_id, spot_id, user_id, created_at, created_epoch, cost=None):
+    cursor.execute('''
+        INSERT INTO reservation_events
+            (event_type, reservation_id, lot_id, spot_id, user_id, cost, created_at, created_epoch)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (event_type, reservation_id, lot_id, spot_id, user_id, cost, created_at, created_epoch))
+
+def latest_event_id(conn=None):
+    conn = conn or get_db_connection()
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM reservation_events').fetchone()[0]
+
+def read_events(after, until=None, event_types=EVENT_TYPES, limit=EVENT_BATCH_SIZE, conn=None):
+    """Events with after < id <= until, oldest first, at most limit of them.
+
+    Pass the id of the last event returned as the next call's `after`.
+    Fixing `until` at latest_event_id() before reading lets a consumer
+    process a closed range even while new events are appended.
+    """
+    conn = conn or get_db_connection()
+    placeholders = ', '.join('?' * len(event_types))
+    rows = conn.execute(f'''
+        SELECT * FROM reservation_events
+        WHERE id > ? AND id <= COALESCE(?, id) AND event_type IN ({placeholders})
+        ORDER BY id
+        LIMIT ?
+    ''', (after, until, *event_types, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+def committed_offset(consumer, conn=None):
+    # 0 for a consumer that has never committed, so it starts from the beginning.
+    conn = conn or get_db_connection()
+    row = conn.execute('SELECT last_id FROM consumer_offsets WHERE name = ?', (consumer,)).fetchone()
+    return row[0] if row else 0
+
+def read_from(consumer, until=None, event_types=EVENT_TYPES, limit=EVENT_BATCH_SIZE, conn=None):
+    """The next events for consumer, after the offset it last committed.
+
+    Nothing is recorded until the consumer calls commit(), so events read
+    but not applied are read again next time.
+    """
+    conn = conn or get_db_connection()
+    return read_events(committed_offset(consumer, conn), until, event_types, limit, conn)
+
+def commit(consumer, last_id, conn=None):
+    # Only writes the offset; the caller commits it together with its own changes.
+    conn = conn or get_db_connection()
+    conn.execute('''
+        INSERT INTO consumer_offsets (name, last_id) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+    ''', (consumer, last_id))
+
+def cancelled_count(user_id, conn=None):
+    # Cancelled reservations are deleted, so the log is the only record of them.
+    conn = conn or get_db_connection()
+    return conn.execute('''
+        SELECT COUNT(*) FROM reservation_events WHERE user_id = ? AND event_type = 'cancelled'
+    ''', (user_id,)).fetchone()[0]
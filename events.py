@@ -0,0 +1,70 @@
+import json
+import queue
+import threading
+
+
+SUBSCRIBER_QUEUE_SIZE = 100
+STREAM_KEEPALIVE_SECONDS = 15
+# Every open stream holds a server thread, so a worker serves at most this
+# many at once; keep it well below the worker's thread count.
+MAX_STREAMS = 4
+STREAM_RETRY_SECONDS = 30
+
+class EventBroker:
+    """In-process fan-out of write-path events to Server-Sent Event streams.
+
+    Topics are tuples such as ('user', user_id) or ('lot', lot_id). Each
+    stream owns a bounded queue; a subscriber that falls behind has its
+    backlog replaced by a single 'resync' event, after which it re-sends a
+    snapshot instead of replaying every delta. At most max_streams
+    subscribers are open at once; subscribe() returns None past that.
+    """
+
+    def __init__(self, max_streams=MAX_STREAMS):
+        self.max_streams = max_streams
+        self.stats = {'opened': 0, 'refused': 0}
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if self._count >= self.max_streams:
+                self.stats['refused'] += 1
+                return None
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+            self._count += 1
+            self.stats['opened'] += 1
+        return subscriber
+
+    def unsubscribe(self, topic, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None and subscriber in subscribers:
+                subscribers.remove(subscriber)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event_type, data))
+            except queue.Full:
+                _drain(subscriber)
+                subscriber.put_nowait(('resync', {}))
+
+def _drain(subscriber):
+    try:
+        while True:
+            subscriber.get_nowait()
+    except queue.Empty:
+        pass
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+event_broker = EventBroker()
@@ -0,0 +1,33 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+
+bind = os.environ.get('PARKING_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('PARKING_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Threads rather than sync workers, but streams are not free: every open
+# live-cost or occupancy stream holds one of these threads for as long as
+# its page stays open. Each worker serves at most PARKING_MAX_STREAMS
+# (default 4) and refuses more with a 503. Admin and user report pages hold
+# up to PARKING_ADMIN_REPORT_CONCURRENCY and PARKING_USER_REPORT_CONCURRENCY
+# more (default 2 each), so keep threads well above the three together.
+worker_class = 'gthread'
+threads = int(os.environ.get('PARKING_THREADS', 16))
+
+# Every thread may hold a pooled SQLite connection, and connections checked
+# in past PARKING_POOL_SIZE are closed, so the pool defaults to one per
+# thread. This file is read before the app is preloaded, which picks it up.
+os.environ.setdefault('PARKING_POOL_SIZE', str(threads))
+
+# The master imports the app and initializes the schema once, then forks;
+# workers start without repeating either. create_app closes its connections
+# first, so no SQLite handle is shared across the fork.
+preload_app = True
+
+# Recycle workers now and then to bound memory growth, staggered so they do
+# not all restart at once.
+max_requests = 5000
+max_requests_jitter = 500
+graceful_timeout = 30
+keepalive = 5
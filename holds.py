@@ -0,0 +1,124 @@
+import heapq
+import logging
+import os
+import threading
+import time
+
+
+HOLD_TIMEOUT_SECONDS = 15 * 60
+HOLD_EXPIRY_BATCH_SIZE = 500
+HOLD_RETRY_SECONDS = 5
+
+logger = logging.getLogger('parking.holds')
+
+class HoldExpiryScheduler:
+    """Releases 'reserved' holds that are never started.
+
+    Pending expiries are kept in a min-heap of (due epoch, reservation id)
+    and one daemon thread sleeps until the earliest is due, then hands every
+    due id to expire() in batches. The heap is filled from the database once
+    when the thread starts and after that by schedule() as bookings are
+    made, so the reservations table is never rescanned. Holds started or
+    cancelled in the meantime stay in the heap and are skipped by expire()
+    when they come due.
+    """
+
+    def __init__(self, timeout=HOLD_TIMEOUT_SECONDS, batch_size=HOLD_EXPIRY_BATCH_SIZE):
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.stats = {'scheduled': 0, 'expired': 0, 'batches': 0, 'errors': 0}
+        self._heap = []
+        self._cond = threading.Condition()
+        self._pid = None
+        self._generation = 0
+
+    def configure(self, timeout=None, batch_size=None):
+        # A timeout of 0 or None turns expiry off.
+        with self._cond:
+            self.timeout = timeout
+            if batch_size is not None:
+                self.batch_size = batch_size
+
+    def reset(self):
+        # Forgets every pending expiry and stops the thread, e.g. when the
+        # app is pointed at another database; the next request starts a
+        # fresh thread, which reloads the holds from the new one.
+        with self._cond:
+            self._generation += 1
+            self._heap = []
+            self._pid = None
+            self._cond.notify_all()
+
+    def start(self, load, expire):
+        # Threads do not survive fork(), so every worker process starts its
+        # own, the first time it serves a request. load() returns
+        # (reservation_id, created_epoch) for every hold still pending.
+        if self._pid == os.getpid() or not self.timeout:
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._heap = []
+            generation = self._generation
+        threading.Thread(target=self._run, args=(load, expire, generation), name='hold-expiry', daemon=True).start()
+
+    def schedule(self, reservation_id, created_epoch):
+        if not self.timeout:
+            return
+        entry = (created_epoch + self.timeout, reservation_id)
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            self.stats['scheduled'] += 1
+            if self._heap[0] == entry:
+                self._cond.notify()
+
+    def _next_batch(self, generation):
+        # Returns None once reset() has replaced this thread.
+        with self._cond:
+            while True:
+                if self._generation != generation:
+                    return None
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    batch = []
+                    while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                        batch.append(heapq.heappop(self._heap)[1])
+                    return batch
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _retry(self, reservation_ids):
+        due = time.time() + HOLD_RETRY_SECONDS
+        with self._cond:
+            self.stats['errors'] += 1
+            for reservation_id in reservation_ids:
+                heapq.heappush(self._heap, (due, reservation_id))
+
+    def _run(self, load, expire, generation):
+        while True:
+            try:
+                pending = load()
+                break
+            except Exception:
+                logger.exception("Could not load pending reservation holds")
+                time.sleep(HOLD_RETRY_SECONDS)
+        if self._generation != generation:
+            return
+        for reservation_id, created_epoch in pending:
+            self.schedule(reservation_id, created_epoch)
+
+        while True:
+            batch = self._next_batch(generation)
+            if batch is None:
+                return
+            try:
+                expired = expire(batch)
+            except Exception:
+                logger.exception("Could not expire %d reservation holds", len(batch))
+                self._retry(batch)
+                continue
+            with self._cond:
+                self.stats['expired'] += expired
+                self.stats['batches'] += 1
+
+hold_scheduler = HoldExpiryScheduler()
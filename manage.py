@@ -0,0 +1,204 @@
+"""Maintenance commands for the parking app database.
+
+Usage: python manage.py <command> [options]
+
+Set PARKING_DB_PATH to work on a database other than parking_app.db.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+
+def repair_counters(args):
+    from app import repair_lot_counters
+
+    drifted = repair_lot_counters()
+    if drifted:
+        print(f"Repaired spot counters for {len(drifted)} lot(s): {', '.join(str(i) for i in drifted)}")
+    else:
+        print("All lot spot counters are consistent")
+
+
+def read_lot_rows(path):
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path) as f:
+            data = json.load(f)
+        return data['lots'] if isinstance(data, dict) else data
+
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def parse_lot_row(row):
+    # Accept the admin form's field names as well as the column names.
+    row = {key.strip(): value for key, value in row.items() if key}
+    name = row.get('prime_location_name') or row.get('location_name')
+    max_spots = row.get('maximum_spots') or row.get('max_spots')
+
+    price_per_hour = float(row['price_per_hour'])
+    max_spots = int(max_spots)
+    if not name or not row.get('address') or not row.get('pin_code'):
+        raise ValueError("location name, address and pin code are required")
+    if max_spots <= 0:
+        raise ValueError("maximum spots must be greater than 0")
+    if price_per_hour <= 0:
+        raise ValueError("price per hour must be greater than 0")
+
+    return (name, row['address'], str(row['pin_code']), price_per_hour, max_spots)
+
+
+def import_lots(args):
+    from app import bulk_create_parking_lots
+
+    lots = []
+    for line_number, row in enumerate(read_lot_rows(args.file), start=1):
+        try:
+            lots.append(parse_lot_row(row))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Row {line_number}: {e}")
+            return 1
+
+    started = time.perf_counter()
+    imported_spots = 0
+    for i in range(0, len(lots), args.batch_size):
+        batch = lots[i:i + args.batch_size]
+        bulk_create_parking_lots(batch)
+        imported_spots += sum(lot[4] for lot in batch)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    print(f"Imported {len(lots)} lots and {imported_spots} spots in {elapsed:.2f}s "
+          f"({len(lots) / elapsed:.0f} lots/sec, {imported_spots / elapsed:.0f} spots/sec)")
+    return 0
+
+
+def backfill_rollups(args):
+    from app import rebuild_rollups
+
+    started = time.perf_counter()
+    lot_days, users = rebuild_rollups()
+    print(f"Rebuilt {lot_days} lot-day rollups and {users} user rollups in {time.perf_counter() - started:.2f}s")
+
+
+def archive_reservations(args):
+    from app import archive_completed_reservations
+
+    started = time.perf_counter()
+    archived = archive_completed_reservations(args.older_than_days, args.batch_size)
+    print(f"Archived {archived} completed reservations older than {args.older_than_days} days "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+def export_columns(args):
+    try:
+        import columnar
+    except ImportError:
+        print("export-columns needs numpy: pip install numpy")
+        return 1
+
+    started = time.perf_counter()
+    exported = columnar.export_completed_reservations(args.store, full=args.full)
+    meta = columnar.read_meta(args.store)
+    print(f"Exported {exported} new sessions ({meta['rows']} total) to {args.store} "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+def column_report(args):
+    try:
+        import columnar
+    except ImportError:
+        print("column-report needs numpy: pip install numpy")
+        return 1
+
+    started = time.perf_counter()
+    columns = columnar.load_columns(args.store)
+    report = {
+        'sessions': len(columns['id']),
+        'revenue_by_month': columnar.revenue_by_month(columns),
+        'revenue_by_lot': columnar.revenue_by_lot(columns),
+        'duration_percentiles_hours': columnar.duration_percentiles(columns),
+        'top_users': columnar.user_totals(columns, top=args.top),
+    }
+    report['elapsed_seconds'] = round(time.perf_counter() - started, 4)
+    print(json.dumps(report, indent=2))
+
+
+def billing_report(args):
+    try:
+        import columnar
+    except ImportError:
+        print("billing-report needs numpy: pip install numpy")
+        return 1
+
+    methods = args.methods or list(columnar.BILLING_METHODS)
+    started = time.perf_counter()
+    columns = columnar.load_columns(args.store)
+    since = columnar.day_start(args.since) if args.since else None
+    until = columnar.day_start(args.until) + 86400 if args.until else None
+    comparison = columnar.billing_comparison(columns, methods, since, until)
+    report = {
+        'sessions': sum(lot['sessions'] for lot in comparison.values()),
+        'billed': sum(lot['billed'] for lot in comparison.values()),
+        'revenue': {method: sum(lot['revenue'][method] for lot in comparison.values()) for method in methods},
+        'lots': comparison,
+    }
+    report['elapsed_seconds'] = round(time.perf_counter() - started, 4)
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parking app maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('repair-counters', help="Recompute per-lot spot counters from parking_spots")
+
+    import_parser = subparsers.add_parser('import-lots', help="Bulk-create parking lots from a CSV or JSON file")
+    import_parser.add_argument('file', help="CSV with a header row, or a JSON list of lot objects")
+    import_parser.add_argument('--batch-size', type=int, default=500, help="Lots per transaction")
+
+    subparsers.add_parser('backfill-rollups', help="Rebuild the daily lot and per-user rollups from reservations")
+
+    archive_parser = subparsers.add_parser('archive-reservations',
+                                           help="Move old completed reservations to the archive table")
+    archive_parser.add_argument('--older-than-days', type=int, default=365,
+                                help="Archive sessions booked more than this many days ago")
+    archive_parser.add_argument('--batch-size', type=int, default=5000, help="Reservations moved per transaction")
+
+    export_parser = subparsers.add_parser('export-columns', help="Append newly completed sessions to the NumPy column store")
+    export_parser.add_argument('--store', default='reservation_columns', help="Column store directory")
+    export_parser.add_argument('--full', action='store_true', help="Rewrite the store from scratch")
+
+    report_parser = subparsers.add_parser('column-report', help="Fleet-wide revenue and duration report from the column store")
+    report_parser.add_argument('--store', default='reservation_columns', help="Column store directory")
+    report_parser.add_argument('--top', type=int, default=10, help="Number of top-spending users to list")
+
+    billing_parser = subparsers.add_parser('billing-report',
+                                           help="Per-lot revenue of past sessions under each billing method")
+    billing_parser.add_argument('--store', default='reservation_columns', help="Column store directory")
+    billing_parser.add_argument('--since', help="First booking day to include, YYYY-MM-DD")
+    billing_parser.add_argument('--until', help="Last booking day to include, YYYY-MM-DD")
+    billing_parser.add_argument('--methods', nargs='+', choices=['hourly_rounded', 'minute_precise', 'minimum_hour'],
+                                help="Billing methods to compare (default: all)")
+
+    args = parser.parse_args()
+    # Reports read only the column store; everything else needs the database.
+    if args.command not in ('column-report', 'billing-report'):
+        from app import create_app
+        create_app()
+
+    commands = {
+        'repair-counters': repair_counters,
+        'import-lots': import_lots,
+        'backfill-rollups': backfill_rollups,
+        'archive-reservations': archive_reservations,
+        'export-columns': export_columns,
+        'column-report': column_report,
+        'billing-report': billing_report,
+    }
+    return commands[args.command](args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+import slowlog
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+_local = threading.local()
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+def begin_request():
+    _local.stats = RequestStats()
+
+def end_request():
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times statements and counts fetched rows into the current request's
+    # stats. While the slow-query log is on, each statement's execute and
+    # fetch time is also summed and checked once its rows are consumed.
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        stats = getattr(_local, 'stats', None)
+        if stats is None and slowlog.threshold is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(sql, parameters)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            if stats is not None:
+                stats.statements += 1
+                stats.sql_seconds += elapsed
+            self._begin(sql, parameters, elapsed, failed)
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = getattr(_local, 'stats', None)
+        if stats is None and slowlog.threshold is None:
+            return super().executemany(sql, seq_of_parameters)
+        # Keep the first parameter set, which EXPLAIN needs to bind.
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        if first is not None:
+            rows = itertools.chain((first,), rows)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(sql, rows)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            if stats is not None:
+                stats.statements += 1
+                stats.sql_seconds += elapsed
+            self._begin(sql, first, elapsed, True, executemany=True)
+
+    def _begin(self, sql, parameters, elapsed, finished, executemany=False):
+        self._pending = None
+        if slowlog.threshold is not None:
+            self._pending = [sql, parameters, elapsed, executemany]
+            if finished or self.description is None:
+                self._finish()
+
+    def _finish(self):
+        sql, parameters, elapsed, executemany = self._pending
+        self._pending = None
+        if slowlog.threshold is not None and elapsed >= slowlog.threshold:
+            slowlog.record(self.connection, sql, parameters, elapsed, executemany)
+
+    def _fetched(self, fetch, *args):
+        stats = getattr(_local, 'stats', None)
+        pending = self._pending
+        if stats is None and pending is None:
+            return fetch(*args)
+        started = time.perf_counter()
+        result = fetch(*args)
+        elapsed = time.perf_counter() - started
+        if stats is not None:
+            stats.sql_seconds += elapsed
+            if isinstance(result, list):
+                stats.rows += len(result)
+            elif result is not None:
+                stats.rows += 1
+        if pending is not None:
+            pending[2] += elapsed
+            # A full fetchmany() batch may be followed by more fetches.
+            if not (args and len(result) == args[0]):
+                self._finish()
+        return result
+
+    def fetchone(self):
+        return self._fetched(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetched(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetched(super().fetchall)
+
+    def __next__(self):
+        pending = self._pending
+        if pending is None:
+            row = super().__next__()
+        else:
+            started = time.perf_counter()
+            try:
+                row = super().__next__()
+            except StopIteration:
+                pending[2] += time.perf_counter() - started
+                self._finish()
+                raise
+            pending[2] += time.perf_counter() - started
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.rows += 1
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    # The C implementations of the execute() shortcuts build a plain cursor,
+    # so they are routed through cursor() here to be instrumented too.
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+class EndpointMetrics:
+    def __init__(self):
+        self.responses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+class MetricsRegistry:
+    """Per-endpoint request, latency and SQL totals for this process.
+
+    Each worker process keeps its own registry, as prometheus_client does
+    without its multiprocess mode. Workers share one listening socket, so a
+    scrape of /metrics reaches whichever worker accepts it, and every series
+    carries a pid label naming that worker. Each pid's counters are
+    monotonic on their own, even though consecutive scrapes may reach
+    different workers. Sum rate() over the pid label for fleet totals, e.g.
+    sum without (pid) (rate(parking_http_requests_total[5m])). A worker
+    missed by a scrape only leaves a gap in its own series. A recycled
+    worker starts a new one.
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, stats):
+        elapsed = time.perf_counter() - stats.started
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics()
+            key = (method, status)
+            metrics.responses[key] = metrics.responses.get(key, 0) + 1
+            metrics.latency.observe(elapsed)
+            metrics.statements.observe(stats.statements)
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.rows += stats.rows
+
+    def render(self, extra_counters=()):
+        # extra_counters is an iterable of (name, help, {labels_tuple: value}).
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+
+            _header(lines, 'parking_http_requests_total', 'HTTP responses by endpoint, method and status.', 'counter')
+            for endpoint, metrics in endpoints:
+                for (method, status), count in sorted(metrics.responses.items()):
+                    lines.append(f'parking_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            _header(lines, 'parking_http_request_duration_seconds', 'Request latency until the response is returned.', 'histogram')
+            for endpoint, metrics in endpoints:
+                _histogram(lines, 'parking_http_request_duration_seconds', endpoint, metrics.latency)
+
+            _header(lines, 'parking_sql_statements_per_request', 'SQL statements executed per request.', 'histogram')
+            for endpoint, metrics in endpoints:
+                _histogram(lines, 'parking_sql_statements_per_request', endpoint, metrics.statements)
+
+            _header(lines, 'parking_sql_statements_total', 'SQL statements executed.', 'counter')
+            for endpoint, metrics in endpoints:
+                lines.append(f'parking_sql_statements_total{_labels(endpoint=endpoint)} {int(metrics.statements.sum)}')
+
+            _header(lines, 'parking_sql_seconds_total', 'Time spent executing SQL and fetching rows.', 'counter')
+            for endpoint, metrics in endpoints:
+                lines.append(f'parking_sql_seconds_total{_labels(endpoint=endpoint)} {metrics.sql_seconds:.6f}')
+
+            _header(lines, 'parking_sql_rows_fetched_total', 'Rows fetched from SQL results.', 'counter')
+            for endpoint, metrics in endpoints:
+                lines.append(f'parking_sql_rows_fetched_total{_labels(endpoint=endpoint)} {metrics.rows}')
+
+        for name, help_text, values in extra_counters:
+            _header(lines, name, help_text, 'counter')
+            for labels, value in sorted(values.items()):
+                lines.append(f'{name}{_labels(**dict(labels))} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+def _header(lines, name, help_text, metric_type):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+
+def _labels(**labels):
+    labels = dict(pid=os.getpid(), **labels)
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+def _histogram(lines, name, endpoint, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le="+Inf")} {histogram.total}')
+    lines.append(f'{name}_sum{_labels(endpoint=endpoint)} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{_labels(endpoint=endpoint)} {histogram.total}')
+
+metrics_registry = MetricsRegistry()
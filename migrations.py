@@ -0,0 +1,232 @@
+import sqlite3
+
+from db import get_db_connection
+
+
+# Each migration is (version, description, [statements]). Versions must be
+# strictly increasing; append new migrations, never edit applied ones.
+MIGRATIONS = [
+    (1, 'Indexes for hot reservation, spot and lot lookups', [
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_user_active
+            ON reservations (user_id) WHERE status IN ('reserved', 'occupied')''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_user_created
+            ON reservations (user_id, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_spot_active
+            ON reservations (spot_id) WHERE status IN ('reserved', 'occupied')''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_spot_status
+            ON reservations (spot_id, status)''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_status_created
+            ON reservations (status, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_parking_spots_lot_status
+            ON parking_spots (lot_id, status)''',
+        '''CREATE INDEX IF NOT EXISTS idx_parking_lots_active
+            ON parking_lots (created_at) WHERE is_active = 1''',
+    ]),
+    (2, 'Denormalized spot counters on parking_lots', [
+        'ALTER TABLE parking_lots ADD COLUMN total_spots INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE parking_lots ADD COLUMN available_spots INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE parking_lots ADD COLUMN occupied_spots INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE parking_lots
+            SET total_spots = (SELECT COUNT(*) FROM parking_spots ps WHERE ps.lot_id = parking_lots.id),
+                available_spots = (SELECT COUNT(*) FROM parking_spots ps
+                                   WHERE ps.lot_id = parking_lots.id AND ps.status = 'A'),
+                occupied_spots = (SELECT COUNT(*) FROM parking_spots ps
+                                  WHERE ps.lot_id = parking_lots.id AND ps.status = 'O')''',
+        '''CREATE INDEX IF NOT EXISTS idx_parking_lots_available
+            ON parking_lots (available_spots) WHERE is_active = 1''',
+    ]),
+    (3, 'Daily per-lot and per-user usage rollups', [
+        '''CREATE TABLE IF NOT EXISTS lot_daily_stats (
+            lot_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            billed_hours REAL NOT NULL DEFAULT 0,
+            duration_hours REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (lot_id, day)
+        ) WITHOUT ROWID''',
+        '''CREATE INDEX IF NOT EXISTS idx_lot_daily_stats_day ON lot_daily_stats (day)''',
+        '''CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            completed_sessions INTEGER NOT NULL DEFAULT 0,
+            total_spent REAL NOT NULL DEFAULT 0
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_created ON reservations (created_at)''',
+        '''INSERT INTO lot_daily_stats (lot_id, day, sessions, revenue, billed_hours, duration_hours)
+            SELECT ps.lot_id, substr(r.created_at, 1, 10), COUNT(*),
+                COALESCE(SUM(r.parking_cost), 0),
+                COALESCE(SUM(CASE WHEN r.rate_at_booking > 0 THEN r.parking_cost / r.rate_at_booking ELSE 0 END), 0),
+                COALESCE(SUM((julianday(r.leaving_timestamp) - julianday(r.parking_timestamp)) * 24), 0)
+            FROM reservations r
+            JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.status = 'completed'
+            GROUP BY ps.lot_id, substr(r.created_at, 1, 10)''',
+        '''INSERT INTO user_stats (user_id, completed_sessions, total_spent)
+            SELECT user_id, COUNT(*), COALESCE(SUM(parking_cost), 0)
+            FROM reservations
+            WHERE status = 'completed'
+            GROUP BY user_id''',
+    ]),
+    (4, 'Index for per-user completed-session analytics', [
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_user_completed
+            ON reservations (user_id, created_at) WHERE status = 'completed'
+        ''',
+    ]),
+    (5, 'Shared version counter for read-through cache invalidation', [
+        '''CREATE TABLE IF NOT EXISTS cache_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+        'INSERT OR IGNORE INTO cache_version (id, version) VALUES (1, 0)',
+    ]),
+    (6, 'Archive tier for old completed reservations, read through reservation_history', [
+        '''CREATE TABLE IF NOT EXISTS reservations_archive (
+            id INTEGER PRIMARY KEY,
+            spot_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            parking_timestamp TIMESTAMP,
+            leaving_timestamp TIMESTAMP,
+            parking_cost REAL DEFAULT 0.0,
+            rate_at_booking REAL DEFAULT 0.0,
+            status TEXT NOT NULL DEFAULT 'completed' CHECK (status = 'completed'),
+            created_at TIMESTAMP,
+            FOREIGN KEY (spot_id) REFERENCES parking_spots (id),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_archive_user_created
+            ON reservations_archive (user_id, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_archive_created
+            ON reservations_archive (created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_archive_spot
+            ON reservations_archive (spot_id)''',
+        # Reservation ids come from AUTOINCREMENT and are never reused, so
+        # they stay unique across both tiers.
+        '''CREATE VIEW IF NOT EXISTS reservation_history AS
+            SELECT id, spot_id, user_id, parking_timestamp, leaving_timestamp,
+                parking_cost, rate_at_booking, status, created_at
+            FROM reservations
+            UNION ALL
+            SELECT id, spot_id, user_id, parking_timestamp, leaving_timestamp,
+                parking_cost, rate_at_booking, status, created_at
+            FROM reservations_archive''',
+    ]),
+    (7, 'Integer UTC epoch columns for reservation times', [
+        'ALTER TABLE reservations ADD COLUMN created_epoch INTEGER',
+        'ALTER TABLE reservations ADD COLUMN parking_epoch INTEGER',
+        'ALTER TABLE reservations ADD COLUMN leaving_epoch INTEGER',
+        'ALTER TABLE reservations_archive ADD COLUMN created_epoch INTEGER',
+        'ALTER TABLE reservations_archive ADD COLUMN parking_epoch INTEGER',
+        'ALTER TABLE reservations_archive ADD COLUMN leaving_epoch INTEGER',
+        # Text timestamps are IST wall-clock time; strftime reads them as UTC.
+        '''UPDATE reservations
+            SET created_epoch = CAST(strftime('%s', created_at) AS INTEGER) - 19800,
+                parking_epoch = CAST(strftime('%s', parking_timestamp) AS INTEGER) - 19800,
+                leaving_epoch = CAST(strftime('%s', leaving_timestamp) AS INTEGER) - 19800''',
+        '''UPDATE reservations_archive
+            SET created_epoch = CAST(strftime('%s', created_at) AS INTEGER) - 19800,
+                parking_epoch = CAST(strftime('%s', parking_timestamp) AS INTEGER) - 19800,
+                leaving_epoch = CAST(strftime('%s', leaving_timestamp) AS INTEGER) - 19800''',
+        'DROP INDEX IF EXISTS idx_reservations_status_created',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_status_created_epoch
+            ON reservations (status, created_epoch)''',
+        'DROP INDEX IF EXISTS idx_reservations_user_completed',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_user_completed_epoch
+            ON reservations (user_id, created_epoch) WHERE status = 'completed'
+        ''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservations_archive_user_created_epoch
+            ON reservations_archive (user_id, created_epoch)''',
+        'DROP VIEW IF EXISTS reservation_history',
+        '''CREATE VIEW reservation_history AS
+            SELECT id, spot_id, user_id, parking_timestamp, leaving_timestamp,
+                parking_cost, rate_at_booking, status, created_at,
+                created_epoch, parking_epoch, leaving_epoch
+            FROM reservations
+            UNION ALL
+            SELECT id, spot_id, user_id, parking_timestamp, leaving_timestamp,
+                parking_cost, rate_at_booking, status, created_at,
+                created_epoch, parking_epoch, leaving_epoch
+            FROM reservations_archive''',
+    ]),
+    (8, 'Append-only log of reservation state changes', [
+        # AUTOINCREMENT so an event id is never reused; consumers keep the
+        # last id they processed as their offset. No foreign keys: the log
+        # outlives cancelled and archived reservations and deleted lots.
+        '''CREATE TABLE IF NOT EXISTS reservation_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL CHECK (event_type IN ('reserved', 'started', 'ended', 'cancelled')),
+            reservation_id INTEGER NOT NULL,
+            lot_id INTEGER NOT NULL,
+            spot_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            cost REAL,
+            created_at TIMESTAMP NOT NULL,
+            created_epoch INTEGER NOT NULL
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_reservation_events_user_cancelled
+            ON reservation_events (user_id) WHERE event_type = 'cancelled'
+        ''',
+    ]),
+    (9, 'Offsets of reservation event log consumers', [
+        '''CREATE TABLE IF NOT EXISTS consumer_offsets (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0
+        )''',
+    ]),
+    (10, 'Per-spot booking counts for least-used allocation', [
+        # Bumped by the same UPDATE that claims a spot, so the allocator
+        # reads a lot's counts without scanning its reservation history.
+        'ALTER TABLE parking_spots ADD COLUMN times_used INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE parking_spots SET times_used = (
+            SELECT COUNT(*) FROM reservation_history r WHERE r.spot_id = parking_spots.id
+        )''',
+    ]),
+]
+
+def get_schema_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def schema_is_current(conn):
+    # A single read, so workers starting against an up-to-date database
+    # never take the write lock.
+    try:
+        version = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+    except sqlite3.OperationalError:
+        return False
+    return version == MIGRATIONS[-1][0]
+
+def run_migrations():
+    conn = get_db_connection()
+    applied = []
+
+    for version, description, statements in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        # Take the write lock before re-checking so concurrent workers
+        # cannot apply the same migration twice.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('''
+                INSERT INTO schema_version (version, description) VALUES (?, ?)
+            ''', (version, description))
+            conn.commit()
+            applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+
+    if applied:
+        print(f"Applied schema migrations: {', '.join(str(v) for v in applied)}")
+    return applied
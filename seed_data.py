@@ -0,0 +1,323 @@
+"""Fill a database with a large, reproducible synthetic parking history.
+
+Usage: python seed_data.py [--db parking_app.db] [--lots 2000] [--users 200000]
+                           [--reservations 10000000] [--days 730] [--seed 42]
+                           [--end-date 2026-01-31] [--force]
+
+Lots, users and completed reservations are generated from --seed with
+commuter-peak arrival times, log-normal stay lengths, weekend dips, skewed
+lot popularity and a few heavy users, then bulk-inserted into the schema the
+app creates, along with the reservation events the app would have logged
+for them. The same seed and --end-date always produce the same rows.
+"""
+import argparse
+import hashlib
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import db
+
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+AREAS = ['MG Road', 'Koramangala', 'Indiranagar', 'Whitefield', 'Jayanagar', 'Hebbal', 'Electronic City',
+         'Malleshwaram', 'Banashankari', 'Yelahanka', 'Marathahalli', 'HSR Layout', 'Rajajinagar', 'BTM Layout']
+KINDS = ['Mall', 'Metro Station', 'Tech Park', 'Hospital', 'Market', 'Stadium', 'Airport Link', 'Office Complex']
+FIRST_NAMES = ['Aarav', 'Priya', 'Rohan', 'Ananya', 'Vikram', 'Meera', 'Arjun', 'Kavya', 'Rahul', 'Sneha',
+               'Karthik', 'Divya', 'Aditya', 'Pooja', 'Nikhil', 'Lakshmi', 'Siddharth', 'Isha', 'Varun', 'Neha']
+LAST_NAMES = ['Sharma', 'Iyer', 'Reddy', 'Nair', 'Gupta', 'Rao', 'Patel', 'Menon', 'Singh', 'Kumar',
+              'Das', 'Joshi', 'Shetty', 'Bhat', 'Pillai']
+
+# Relative arrivals per hour of day: morning and evening commuter peaks.
+HOURLY_WEIGHTS = [1, 0.5, 0.3, 0.3, 0.5, 1.5, 4, 9, 14, 12, 9, 8, 9, 8, 7, 7, 9, 12, 13, 10, 8, 6, 4, 2]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 1.1, 0.75, 0.6]
+
+# Stays are log-normal around a 90 minute median, clipped to 5 minutes .. 1 day.
+MEDIAN_STAY_MINUTES = 90
+STAY_SIGMA = 0.9
+MIN_STAY_MINUTES = 5
+MAX_STAY_MINUTES = 24 * 60
+MAX_BOOKING_LEAD_SECONDS = 30 * 60
+
+# Share of spots left reserved or occupied at the end of the history.
+ACTIVE_SPOT_SHARE = 0.3
+
+class Timestamps:
+    # Formats naive IST seconds as the app's text timestamps from cached date
+    # and time-of-day strings, so millions of rows avoid strftime.
+    def __init__(self, start_day):
+        self.epoch = datetime(start_day.year, start_day.month, start_day.day)
+        self.utc_offset = int(self.epoch.replace(tzinfo=IST).timestamp())
+        self._days = {}
+        self._times = [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in range(86400)]
+
+    def seconds(self, day, second_of_day=0):
+        return (day - self.epoch.date()).days * 86400 + second_of_day
+
+    def format(self, seconds):
+        day, second = divmod(int(seconds), 86400)
+        prefix = self._days.get(day)
+        if prefix is None:
+            prefix = self._days[day] = (self.epoch + timedelta(days=day)).strftime('%Y-%m-%d ')
+        return prefix + self._times[second]
+
+    def utc(self, seconds):
+        # UTC epoch seconds for the reservations' *_epoch columns.
+        return self.utc_offset + int(seconds)
+
+def cumulative(weights):
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+def allocate(total, weights):
+    # Splits total into integer counts proportional to weights, summing exactly.
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    remainders = sorted(range(len(weights)), key=lambda i: weights[i] * scale % 1, reverse=True)
+    for i in remainders[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+def parking_cost(stay_seconds, rate):
+    # Matches calculate_parking_cost's hourly_rounded billing.
+    hours = stay_seconds / 3600
+    return (1 if hours <= 1 else math.ceil(hours)) * rate
+
+def seed_lots(parking, cursor, rng, count, min_spots, max_spots, clock, first_day):
+    lots = []
+    for i in range(count):
+        name = f'{rng.choice(AREAS)} {rng.choice(KINDS)} {i + 1}'
+        price = rng.choice([10, 15, 20, 20, 25, 30, 30, 40, 50, 60, 80, 100])
+        spots = int(min_spots + (max_spots - min_spots) * rng.random() ** 2)
+        created = clock.format(clock.seconds(first_day) + rng.randrange(86400))
+        lot_id = parking.insert_parking_lot(cursor, name, f'{rng.randint(1, 999)} {rng.choice(AREAS)}',
+                                            str(560000 + rng.randint(1, 110)), float(price), spots, created)
+        lots.append((lot_id, float(price)))
+
+    spots_by_lot = {}
+    for lot_id, spot_id in cursor.execute('SELECT lot_id, id FROM parking_spots ORDER BY id'):
+        spots_by_lot.setdefault(lot_id, []).append(spot_id)
+    return lots, spots_by_lot
+
+def seed_users(cursor, rng, count, clock, first_day, days, batch_size):
+    password_hash = hashlib.sha256('password123'.encode()).hexdigest()
+    first_id = (cursor.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]) + 1
+    for start in range(0, count, batch_size):
+        cursor.executemany('''
+            INSERT INTO users (id, username, email, full_name, password_hash, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(first_id + i, f'seed_user{first_id + i}', f'seed_user{first_id + i}@example.com',
+               f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', password_hash,
+               clock.format(clock.seconds(first_day) + rng.randrange(days * 86400)))
+              for i in range(start, min(start + batch_size, count))])
+    return list(range(first_id, first_id + count))
+
+def completed_rows(rng, day_seconds, count, now, users, user_cum, lots, lot_cum, spots_by_lot, clock):
+    hours = rng.choices(range(24), weights=HOURLY_WEIGHTS, k=count)
+    random_ = rng.random
+    arrivals = sorted(day_seconds + hour * 3600 + int(random_() * 3600) for hour in hours)
+    chosen_users = rng.choices(users, cum_weights=user_cum, k=count)
+    chosen_lots = rng.choices(lots, cum_weights=lot_cum, k=count)
+    mu = math.log(MEDIAN_STAY_MINUTES)
+
+    rows = []
+    for arrival, user_id, (lot_id, rate) in zip(arrivals, chosen_users, chosen_lots):
+        spots = spots_by_lot[lot_id]
+        booked = max(arrival - int(random_() * MAX_BOOKING_LEAD_SECONDS), day_seconds)
+        stay = 60 * min(max(rng.lognormvariate(mu, STAY_SIGMA), MIN_STAY_MINUTES), MAX_STAY_MINUTES)
+        leaving = min(arrival + int(stay), now)
+        rows.append((spots[int(random_() * len(spots))], user_id, clock.format(arrival), clock.format(leaving),
+                     parking_cost(leaving - arrival, rate), rate, 'completed', clock.format(booked),
+                     clock.utc(booked), clock.utc(arrival), clock.utc(leaving)))
+    rows.sort(key=lambda row: row[7])
+    return rows
+
+def seed_active(cursor, rng, users, lots, spots_by_lot, now, clock):
+    # A share of spots ends up held, each by a different user, so the data
+    # satisfies the one-active-reservation-per-user rule.
+    rates = dict(lots)
+    free = [(lot_id, spot_id) for lot_id, spots in spots_by_lot.items() for spot_id in spots]
+    held = rng.sample(free, min(int(len(free) * ACTIVE_SPOT_SHARE), len(users)))
+    holders = rng.sample(users, len(held))
+
+    rows = []
+    for (lot_id, spot_id), user_id in zip(held, holders):
+        booked = now - rng.randrange(6 * 3600)
+        if rng.random() < 0.7:
+            parked = min(booked + rng.randrange(MAX_BOOKING_LEAD_SECONDS), now)
+            rows.append((spot_id, user_id, clock.format(parked), None, 0.0, rates[lot_id], 'occupied', clock.format(booked),
+                         clock.utc(booked), clock.utc(parked), None))
+        else:
+            rows.append((spot_id, user_id, None, None, 0.0, rates[lot_id], 'reserved', clock.format(booked),
+                         clock.utc(booked), None, None))
+    rows.sort(key=lambda row: row[7])
+
+    cursor.executemany('''
+        INSERT INTO reservations (spot_id, user_id, parking_timestamp, leaving_timestamp, parking_cost,
+            rate_at_booking, status, created_at, created_epoch, parking_epoch, leaving_epoch)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    cursor.executemany("UPDATE parking_spots SET status = 'O' WHERE id = ?", [(row[0],) for row in rows])
+    return len(rows)
+
+def seed_events(cursor, first_id):
+    # The reserved, started and ended events of every reservation from
+    # first_id on, appended in the order they happened, as the app would
+    # have logged them.
+    cursor.execute('''
+        INSERT INTO reservation_events
+            (event_type, reservation_id, lot_id, spot_id, user_id, cost, created_at, created_epoch)
+        SELECT event_type, reservation_id, lot_id, spot_id, user_id, cost, created_at, created_epoch
+        FROM (
+            SELECT 0 as step, 'reserved' as event_type, r.id as reservation_id, ps.lot_id, r.spot_id, r.user_id,
+                NULL as cost, r.created_at, r.created_epoch
+            FROM reservations r JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id >= ?
+            UNION ALL
+            SELECT 1, 'started', r.id, ps.lot_id, r.spot_id, r.user_id, NULL, r.parking_timestamp, r.parking_epoch
+            FROM reservations r JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id >= ? AND r.parking_epoch IS NOT NULL
+            UNION ALL
+            SELECT 2, 'ended', r.id, ps.lot_id, r.spot_id, r.user_id, r.parking_cost, r.leaving_timestamp,
+                r.leaving_epoch
+            FROM reservations r JOIN parking_spots ps ON r.spot_id = ps.id
+            WHERE r.id >= ? AND r.status = 'completed'
+        )
+        ORDER BY created_epoch, reservation_id, step
+    ''', (first_id, first_id, first_id))
+    return cursor.rowcount
+
+_worker_context = {}
+
+def _init_worker(context):
+    _worker_context.update(context)
+
+def _generate_day(task):
+    # Each day has its own generator seeded from (seed, day), so the rows do
+    # not depend on how days are spread over worker processes.
+    day, count = task
+    c = _worker_context
+    rng = random.Random(f"{c['seed']}:{day}")
+    return completed_rows(rng, c['clock'].seconds(c['first_day'] + timedelta(days=day)), count, c['now'],
+                          c['users'], c['user_cum'], c['lots'], c['lot_cum'], c['spots_by_lot'], c['clock'])
+
+def seed_reservations(cursor, rng, args, lots, spots_by_lot, users, first_day, now, clock):
+    # Popularity is skewed: a few lots and a few frequent parkers dominate.
+    lot_cum = cumulative(1 / (rank + 1) ** 0.8 for rank in range(len(lots)))
+    user_cum = cumulative(rng.paretovariate(1.5) for _ in users)
+    rng.shuffle(lots)
+    day_weights = [WEEKDAY_WEIGHTS[(first_day + timedelta(days=d)).weekday()] * (0.5 + 0.5 * d / max(args.days - 1, 1))
+                   for d in range(args.days)]
+    context = {'seed': args.seed, 'clock': clock, 'first_day': first_day, 'now': now, 'users': users,
+               'user_cum': user_cum, 'lots': lots, 'lot_cum': lot_cum, 'spots_by_lot': spots_by_lot}
+
+    # Days are generated in worker processes and inserted here in day order,
+    # so completed reservation ids follow created_at as they do in production.
+    loaded = 0
+    started = time.perf_counter()
+    cursor.execute('BEGIN')
+    first_id = cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM reservations').fetchone()[0]
+    with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(context,)) as pool:
+        for rows in pool.imap(_generate_day, enumerate(allocate(args.reservations, day_weights)), chunksize=2):
+            cursor.executemany('''
+                INSERT INTO reservations (spot_id, user_id, parking_timestamp, leaving_timestamp, parking_cost,
+                    rate_at_booking, status, created_at, created_epoch, parking_epoch, leaving_epoch)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            loaded += len(rows)
+            print(f"  {loaded} reservations ({loaded / (time.perf_counter() - started):.0f} rows/sec)", end='\r')
+    active = seed_active(cursor, rng, users, lots, spots_by_lot, now, clock)
+    print(f"\nInserted {loaded} completed and {active} active reservations in {time.perf_counter() - started:.1f}s")
+    events_started = time.perf_counter()
+    events = seed_events(cursor, first_id)
+    print(f"Logged {events} reservation events in {time.perf_counter() - events_started:.1f}s")
+    return loaded, active
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=db.DB_PATH, help="Database file to fill (created if missing)")
+    parser.add_argument('--lots', type=int, default=2000)
+    parser.add_argument('--min-spots', type=int, default=20)
+    parser.add_argument('--max-spots', type=int, default=400)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--reservations', type=int, default=10000000, help="Completed reservations to generate")
+    parser.add_argument('--days', type=int, default=730, help="Length of the history")
+    parser.add_argument('--end-date', help="History runs up to midnight starting this day, YYYY-MM-DD (default: today in IST)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=50000, help="Users per executemany call")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes generating reservations")
+    parser.add_argument('--force', action='store_true', help="Seed even if the database already has reservations")
+    args = parser.parse_args()
+
+    import app as parking
+    # create_app creates the schema and runs migrations on the target file.
+    parking.create_app({'DB_PATH': args.db})
+
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    if cursor.execute('SELECT EXISTS (SELECT 1 FROM reservations)').fetchone()[0] and not args.force:
+        print(f"{args.db} already has reservations; use --force to add a synthetic history anyway")
+        return 1
+
+    ist_today = datetime.now(IST).date()
+    end_day = date.fromisoformat(args.end_date) if args.end_date else ist_today
+    first_day = end_day - timedelta(days=args.days)
+    clock = Timestamps(first_day)
+    # Nothing is generated past midnight of the end date, so no timestamp is
+    # ever in the future; the active reservations are the ones held then.
+    now = clock.seconds(end_day)
+    rng = random.Random(args.seed)
+
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    started = time.perf_counter()
+
+    cursor.execute('BEGIN IMMEDIATE')
+    lots, spots_by_lot = seed_lots(parking, cursor, rng, args.lots, args.min_spots, args.max_spots, clock, first_day)
+    users = seed_users(cursor, rng, args.users, clock, first_day, args.days, args.batch_size)
+    conn.commit()
+    spot_count = sum(len(spots) for spots in spots_by_lot.values())
+    print(f"Created {len(lots)} lots, {spot_count} spots and {len(users)} users "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    # Reservation indexes are rebuilt once at the end instead of row by row.
+    indexes = cursor.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'reservations' AND sql IS NOT NULL
+    ''').fetchall()
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX {name}')
+    try:
+        loaded, active = seed_reservations(cursor, rng, args, lots, spots_by_lot, users, first_day, now, clock)
+        conn.commit()
+    finally:
+        conn.rollback()
+        index_started = time.perf_counter()
+        for _, sql in indexes:
+            cursor.execute(sql)
+        conn.commit()
+        print(f"Rebuilt {len(indexes)} reservation indexes in {time.perf_counter() - index_started:.1f}s")
+
+    cursor.execute('BEGIN IMMEDIATE')
+    parking.refresh_lot_counters(cursor)
+    parking.refresh_spot_usage(cursor)
+    parking.bump_cache_version(cursor)
+    conn.commit()
+    lot_days, user_rollups = parking.rebuild_rollups()
+    cursor.execute('ANALYZE')
+    print(f"Rebuilt {lot_days} lot-day and {user_rollups} user rollups; "
+          f"total {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from flask import has_request_context, request
+
+
+# Every worker process appends to this one file. Python's rotating handlers
+# cannot be shared between processes, so rotation is left to an external
+# tool such as logrotate: the WatchedFileHandler reopens the path once the
+# file has been moved away.
+SLOW_QUERY_LOG_PATH = os.environ.get('PARKING_SLOW_QUERY_LOG', 'slow_queries.log')
+DEFAULT_THRESHOLD_MS = 100
+SLOW_QUERY_TAIL_BYTES = 1024 * 1024
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def _threshold_from_env():
+    # PARKING_SLOW_QUERY_MS sets the threshold in milliseconds; "off" disables the log.
+    value = os.environ.get('PARKING_SLOW_QUERY_MS', str(DEFAULT_THRESHOLD_MS)).strip().lower()
+    if value == 'off':
+        return None
+    try:
+        milliseconds = float(value)
+    except ValueError:
+        milliseconds = -1
+    if not milliseconds >= 0:
+        print(f"Ignoring PARKING_SLOW_QUERY_MS={value!r}: expected milliseconds or 'off'; "
+              f"using {DEFAULT_THRESHOLD_MS}", file=sys.stderr)
+        milliseconds = DEFAULT_THRESHOLD_MS
+    return milliseconds / 1000
+
+# Seconds; read by the instrumented cursors on every statement.
+threshold = _threshold_from_env()
+
+_logger = logging.getLogger('parking.slow_queries')
+_logger.propagate = False
+_handler_lock = threading.Lock()
+
+_COMMENTS = re.compile(r'--[^\n]*')
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def normalize_sql(sql):
+    sql = _WHITESPACE.sub(' ', _COMMENTS.sub(' ', sql)).strip()
+    return _LITERALS.sub('?', sql)
+
+def parameter_shape(parameters):
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+def explain(conn, sql, parameters):
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        # The base class method runs on a plain cursor, so the EXPLAIN is
+        # neither instrumented nor able to log itself.
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters or ()).fetchall()
+    except sqlite3.Error as e:
+        return [f'(plan unavailable: {e})']
+    depths = {0: -1}
+    plan = []
+    for node_id, parent_id, _, detail in rows:
+        depths[node_id] = depths.get(parent_id, -1) + 1
+        plan.append('  ' * depths[node_id] + detail)
+    return plan
+
+def _caller():
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in ('metrics', __name__):
+        frame = frame.f_back
+    if frame is None:
+        return None, None
+    return frame.f_code.co_name, f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}'
+
+def _get_logger():
+    if not _logger.handlers:
+        with _handler_lock:
+            if not _logger.handlers:
+                handler = logging.handlers.WatchedFileHandler(SLOW_QUERY_LOG_PATH, delay=True)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                _logger.addHandler(handler)
+                _logger.setLevel(logging.WARNING)
+    return _logger
+
+def record(conn, sql, parameters, seconds, executemany=False):
+    # Imported here: analytics imports db, which imports this module via metrics.
+    from analytics import IST
+    caller, location = _caller()
+    entry = {
+        'time': datetime.now(IST).strftime('%Y-%m-%d %H:%M:%S'),
+        'duration_ms': round(seconds * 1000, 3),
+        'sql': normalize_sql(sql),
+        'parameters': parameter_shape(parameters),
+        'executemany': executemany,
+        'caller': caller,
+        'location': location,
+        'endpoint': request.endpoint if has_request_context() else None,
+        'plan': explain(conn, sql, parameters),
+    }
+    _get_logger().warning(json.dumps(entry))
+    return entry
+
+def read_recent(limit=200):
+    """Newest-first entries from the tail of the current log file.
+
+    Every worker process appends to the same file, so the admin page sees
+    slow statements from all of them.
+    """
+    try:
+        with open(SLOW_QUERY_LOG_PATH, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - SLOW_QUERY_TAIL_BYTES))
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    if size > SLOW_QUERY_TAIL_BYTES:
+        lines = lines[1:]
+
+    entries = []
+    for line in reversed(lines):
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+        if len(entries) >= limit:
+            break
+    return entries
+
+def summarize(entries):
+    # Groups entries by normalized SQL, worst total time first; the plan
+    # shown is the one from the newest entry.
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['sql'])
+        if group is None:
+            group = groups[entry['sql']] = {
+                'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'last_seen': entry['time'], 'callers': [], 'plan': entry['plan'],
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        if entry['caller'] and entry['caller'] not in group['callers']:
+            group['callers'].append(entry['caller'])
+    for group in groups.values():
+        group['avg_ms'] = group['total_ms'] / group['count']
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
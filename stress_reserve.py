@@ -0,0 +1,93 @@
+"""Fire many concurrent reservations at one lot and check for double bookings.
+
+Usage: python stress_reserve.py [--users 2000] [--spots 500] [--threads 32]
+                                [--policy lowest_id|round_robin|least_used]
+
+Runs against a throwaway database file, never parking_app.db.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from allocator import POLICIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--spots', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='lowest_id')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='parking_stress_')
+    import app as parking
+    parking.create_app({'DB_PATH': os.path.join(workdir, 'stress.db'), 'ALLOCATION_POLICY': args.policy})
+
+    lot_id = parking.create_parking_lot('Stress Lot', 'Test Road', '000000', 10.0, args.spots)
+
+    conn = db.get_db_connection()
+    conn.executemany('''
+        INSERT INTO users (username, email, full_name, password_hash, created_at)
+        VALUES (?, ?, ?, 'x', ?)
+    ''', [(f'stress{i}', f'stress{i}@example.com', f'Stress User {i}', parking.get_current_timestamp())
+          for i in range(args.users)])
+    conn.commit()
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id')]
+
+    # Every user asks twice so the per-user active check is raced as well.
+    requests = user_ids + user_ids
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda uid: parking.reserve_parking_spot(uid, lot_id), requests))
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(1 for reservation_id, _ in results if reservation_id)
+
+    double_booked_spots = conn.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT spot_id FROM reservations
+            WHERE status IN ('reserved', 'occupied')
+            GROUP BY spot_id HAVING COUNT(*) > 1
+        )
+    ''').fetchone()[0]
+    double_booked_users = conn.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT user_id FROM reservations
+            WHERE status IN ('reserved', 'occupied')
+            GROUP BY user_id HAVING COUNT(*) > 1
+        )
+    ''').fetchone()[0]
+    occupied_spots = conn.execute('''
+        SELECT COUNT(*) FROM parking_spots WHERE lot_id = ? AND status = 'O'
+    ''', (lot_id,)).fetchone()[0]
+    counter_occupied, counter_available = conn.execute('''
+        SELECT occupied_spots, available_spots FROM parking_lots WHERE id = ?
+    ''', (lot_id,)).fetchone()
+
+    expected = min(args.users, args.spots)
+    stats = parking.reserve_stats
+    retry_rate = stats['retries'] / stats['attempts'] if stats['attempts'] else 0
+
+    print(f"Requests:            {len(requests)} over {args.threads} threads ({args.policy})")
+    print(f"Successful bookings: {succeeded} (expected {expected})")
+    print(f"Occupied spots:      {occupied_spots} (lot counters: {counter_occupied} occupied, {counter_available} available)")
+    print(f"Double-booked spots: {double_booked_spots}")
+    print(f"Double-booked users: {double_booked_users}")
+    print(f"Throughput:          {len(requests) / elapsed:.0f} reserves/sec")
+    print(f"Retry rate:          {retry_rate:.2%} ({stats['retries']} of {stats['attempts']} attempts)")
+
+    ok = (succeeded == expected == occupied_spots == counter_occupied
+          and counter_available == args.spots - occupied_spots
+          and double_booked_spots == 0 and double_booked_users == 0)
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
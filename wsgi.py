@@ -0,0 +1,23 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings come from the environment: PARKING_SECRET_KEY (required, shared by
+every worker so sessions survive load balancing), PARKING_DB_PATH,
+PARKING_POOL_SIZE (gunicorn.conf.py defaults it to PARKING_THREADS), and
+PARKING_ADMIN_REPORT_CONCURRENCY and PARKING_USER_REPORT_CONCURRENCY, which
+bound the threads per worker that admin and user report pages may hold; keep
+their sum, plus PARKING_MAX_STREAMS, well below PARKING_THREADS.
+PARKING_MAX_STREAMS caps the live event streams per worker (default 4).
+PARKING_HOLD_TIMEOUT_SECONDS releases reservations not started within that
+time (default 15 minutes; 0 disables).
+PARKING_ALLOCATION_POLICY chooses which free spot a booking gets: lowest_id
+(default), round_robin or least_used.
+"""
+import os
+
+from app import create_app
+
+
+if not os.environ.get('PARKING_SECRET_KEY'):
+    raise RuntimeError("Set PARKING_SECRET_KEY before starting the production server")
+
+app = create_app()